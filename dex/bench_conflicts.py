@@ -0,0 +1,160 @@
+"""Count state conflicts between swaps on unrelated DEX pairs.
+
+Every pair in the workload shares one quote token, and every swap in a block
+runs on a different pair with a different trader. Two transactions conflict
+when one writes a key the other reads or writes, which is what forces an
+optimistic parallel executor to serialize them.
+
+The "on con_pairs state" line counts only conflicts on con_pairs' own keys,
+which is what the contracts control. It is not the total: every swap also
+moves the shared token in or out of con_pairs, so all of them still write
+that token's balances:con_pairs key and "conflicting tx pairs" stays at every
+pair in the block whatever con_pairs does. Swaps that share a token remain
+serialized by the token contract.
+
+    python bench_conflicts.py [--pairs PATH] [--dex PATH] [--blocks N] [--width K]
+
+To compare against an older revision, export its contracts and point the
+script at them:
+
+    git show <rev>:dex/con_pairs.py > /tmp/con_pairs_old.py
+    git show <rev>:dex/con_dex.py > /tmp/con_dex_old.py
+    python bench_conflicts.py --pairs /tmp/con_pairs_old.py --dex /tmp/con_dex_old.py
+"""
+import argparse
+import datetime
+import os
+
+from contracting.client import ContractingClient
+from contracting.stdlib.bridge.time import Datetime
+
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+TOKEN_CODE = '''
+balances = Hash(default_value=0)
+
+@construct
+def seed():
+    balances[ctx.caller] = 1000000000
+
+@export
+def balance_of(address: str):
+    return balances[address]
+
+@export
+def transfer(amount: float, to: str):
+    assert amount > 0, 'Cannot send negative balances!'
+    assert balances[ctx.caller] >= amount, 'Not enough coins to send!'
+    balances[ctx.caller] -= amount
+    balances[to] += amount
+
+@export
+def approve(amount: float, to: str):
+    balances[ctx.caller, to] = amount
+
+@export
+def transfer_from(amount: float, to: str, main_account: str):
+    assert amount > 0, 'Cannot send negative balances!'
+    assert balances[main_account, ctx.caller] >= amount, 'Not enough coins approved!'
+    assert balances[main_account] >= amount, 'Not enough coins to send!'
+    balances[main_account, ctx.caller] -= amount
+    balances[main_account] -= amount
+    balances[to] += amount
+'''
+
+
+def conflicting_keys(a, b):
+    reads_a, writes_a = a
+    reads_b, writes_b = b
+    return (writes_a & (reads_b | writes_b)) | (writes_b & reads_a)
+
+
+def run(pairs_path, dex_path, blocks, width):
+    client = ContractingClient()
+    client.flush()
+
+    now = Datetime._from_datetime(datetime.datetime(2026, 1, 1))
+    deadline = Datetime._from_datetime(datetime.datetime(2026, 1, 2))
+    env = {"now": now}
+
+    with open(pairs_path) as f:
+        pairs_code = f.read()
+    with open(dex_path) as f:
+        dex_code = f.read()
+
+    client.submit(TOKEN_CODE, name='con_bench_currency')
+    client.submit(pairs_code, name='con_pairs')
+    client.submit(dex_code, name='con_dex_v2')
+
+    currency = client.get_contract('con_bench_currency')
+    pairs = client.get_contract('con_pairs')
+    dex = client.get_contract('con_dex_v2')
+
+    if 'def setRouter' in pairs_code:
+        pairs.setRouter(router='con_dex_v2', enabled=True, signer='sys')
+
+    currency.approve(amount=10 ** 9, to='con_dex_v2', signer='sys')
+
+    pair_ids = []
+    for i in range(width):
+        name = 'con_bench_token_{}'.format(i)
+        client.submit(TOKEN_CODE, name=name)
+        token = client.get_contract(name)
+        token.approve(amount=10 ** 9, to='con_dex_v2', signer='sys')
+        dex.addLiquidity(tokenA=name, tokenB='con_bench_currency', amountADesired=100000,
+                         amountBDesired=100000, amountAMin=0, amountBMin=0, to='sys',
+                         deadline=deadline, signer='sys', environment=env)
+        pair_ids.append(pairs.pairFor(tokenA=name, tokenB='con_bench_currency', signer='sys'))
+
+    total = 0
+    total_pairs = 0
+    hot = {}
+    for block in range(blocks):
+        access = []
+        for i, pair in enumerate(pair_ids):
+            trader = 'trader_{}_{}'.format(block, i)
+            currency.transfer(amount=10, to=trader, signer='sys')
+            currency.approve(amount=10, to='con_dex_v2', signer=trader)
+            output = dex.swapExactTokenForToken(amountIn=10, amountOutMin=0, pair=pair,
+                                                src='con_bench_currency', to=trader, deadline=deadline,
+                                                signer=trader, environment=env,
+                                                return_full_output=True)
+            assert output['status_code'] == 0, output['result']
+            access.append((set(output.get('reads', {})), set(output['writes'])))
+
+        for i in range(len(access)):
+            for j in range(i + 1, len(access)):
+                keys = conflicting_keys(access[i], access[j])
+                if keys:
+                    total += 1
+                if any(k.startswith('con_pairs.') for k in keys):
+                    total_pairs += 1
+                for k in keys:
+                    hot[k] = hot.get(k, 0) + 1
+
+    return total, total_pairs, hot
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pairs', default=os.path.join(HERE, 'con_pairs.py'))
+    parser.add_argument('--dex', default=os.path.join(HERE, 'con_dex.py'))
+    parser.add_argument('--blocks', type=int, default=10)
+    parser.add_argument('--width', type=int, default=16)
+    args = parser.parse_args()
+
+    total, total_pairs, hot = run(args.pairs, args.dex, args.blocks, args.width)
+    candidates = args.blocks * args.width * (args.width - 1) // 2
+
+    print('swaps per block:            {}'.format(args.width))
+    print('tx pairs checked:           {}'.format(candidates))
+    print('conflicting tx pairs:       {}'.format(total))
+    print('  on con_pairs state:       {}'.format(total_pairs))
+    print('hottest keys:')
+    for key, count in sorted(hot.items(), key=lambda kv: -kv[1])[:5]:
+        print('  {:<40} {}'.format(key, count))
+
+
+if __name__ == '__main__':
+    main()
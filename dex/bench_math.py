@@ -0,0 +1,267 @@
+"""Compare float and decimal AMM math over many simulated swaps.
+
+Xian contracts never see binary floats: float literals and float arguments
+become ContractingDecimal, a decimal with 30 places that rounds down. This
+script replays one random swap stream against three copies of a pool:
+
+  float      Python floats, i.e. what the formulas would do off-chain or on a
+             float VM (and what UIs that re-implement the math get)
+  decimal    the con_dex / con_pairs formulas under ContractingDecimal rules
+  reference  the same formulas in 100-digit decimals, used as ground truth
+
+For every swap it checks the pair's K invariant exactly and reports how often
+each path's quote would be rejected, how far its reserves drift from the
+reference, and the time the arithmetic takes per swap. On chain only the
+decimal path exists; the float row shows what it would cost and lose.
+
+The microseconds above are Python arithmetic, not stamps. Stamps only exist
+for code the contracting executor runs, and floats can never get that far, so
+there is no float stamp figure to compare. What the script does meter is the
+decimal path itself: the first --contract-swaps entries of the stream are sent
+as exact input swaps through con_pairs and con_dex on a ContractingClient with
+metering on. It reports the stamps each swap used and how many contract
+outputs differ from the decimal model above.
+
+    python bench_math.py [--swaps N] [--seed S] [--reserve R] [--contract-swaps M]
+"""
+import argparse
+import itertools
+import os
+import random
+import time
+from decimal import Context, Decimal, ROUND_FLOOR
+from fractions import Fraction
+
+from contracting.client import ContractingClient
+from contracting.stdlib.bridge.time import Datetime
+from contracting.stdlib.bridge.decimal import ContractingDecimal
+
+from bench_conflicts import TOKEN_CODE
+
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+FEE_BPS = 30
+FEE_DENOMINATOR = 10000
+
+# ContractingDecimal: 61 significant digits, 30 decimal places, rounds down
+CONTRACT = Context(prec=61, rounding=ROUND_FLOOR)
+UNIT = Decimal('1e-30')
+REFERENCE = Context(prec=100)
+
+
+def fix(x):
+    return x.quantize(UNIT, rounding=ROUND_FLOOR, context=CONTRACT)
+
+
+class FloatMath:
+    name = 'float'
+
+    def convert(self, x):
+        return float(x)
+
+    def amount_out(self, amount_in, reserve_in, reserve_out):
+        amount_in_with_fee = amount_in * (FEE_DENOMINATOR - FEE_BPS) / FEE_DENOMINATOR
+        return amount_in_with_fee * reserve_out / (reserve_in + amount_in_with_fee)
+
+    def amount_in(self, amount_out, reserve_in, reserve_out):
+        denominator = (reserve_out - amount_out) * (FEE_DENOMINATOR - FEE_BPS) / FEE_DENOMINATOR
+        return reserve_in * amount_out / denominator
+
+    def add(self, a, b):
+        return a + b
+
+    def sub(self, a, b):
+        return a - b
+
+
+class ContractMath:
+    """getAmountOut / getAmountIn from con_dex, every operation floored."""
+    name = 'decimal'
+
+    def convert(self, x):
+        return fix(Decimal(repr(x)))
+
+    def mul(self, a, b):
+        return fix(CONTRACT.multiply(a, b))
+
+    def div(self, a, b):
+        return fix(CONTRACT.divide(a, b))
+
+    def add(self, a, b):
+        return fix(CONTRACT.add(a, b))
+
+    def sub(self, a, b):
+        return fix(CONTRACT.subtract(a, b))
+
+    def amount_out(self, amount_in, reserve_in, reserve_out):
+        amount_in_with_fee = self.div(self.mul(amount_in, Decimal(FEE_DENOMINATOR - FEE_BPS)),
+                                      Decimal(FEE_DENOMINATOR))
+        numerator = self.mul(amount_in_with_fee, reserve_out)
+        denominator = self.add(reserve_in, amount_in_with_fee)
+        return self.div(numerator, denominator)
+
+    def amount_in(self, amount_out, reserve_in, reserve_out):
+        numerator = self.mul(reserve_in, amount_out)
+        denominator = self.div(self.mul(self.sub(reserve_out, amount_out), Decimal(FEE_DENOMINATOR - FEE_BPS)),
+                               Decimal(FEE_DENOMINATOR))
+        return self.add(self.div(self.add(numerator, UNIT), denominator), UNIT)
+
+
+class ReferenceMath(ContractMath):
+    name = 'reference'
+
+    def convert(self, x):
+        return Decimal(repr(x))
+
+    def mul(self, a, b):
+        return REFERENCE.multiply(a, b)
+
+    def div(self, a, b):
+        return REFERENCE.divide(a, b)
+
+    def add(self, a, b):
+        return REFERENCE.add(a, b)
+
+    def sub(self, a, b):
+        return REFERENCE.subtract(a, b)
+
+    def amount_in(self, amount_out, reserve_in, reserve_out):
+        numerator = self.mul(reserve_in, amount_out)
+        denominator = self.div(self.mul(self.sub(reserve_out, amount_out), Decimal(FEE_DENOMINATOR - FEE_BPS)),
+                               Decimal(FEE_DENOMINATOR))
+        return self.div(numerator, denominator)
+
+
+def k_holds(reserve_in, reserve_out, amount_in, amount_out):
+    """The K check of con_pairs evaluated without any rounding."""
+    reserve_in, reserve_out = Fraction(reserve_in), Fraction(reserve_out)
+    amount_in, amount_out = Fraction(amount_in), Fraction(amount_out)
+    adjusted_in = reserve_in + amount_in - amount_in * FEE_BPS / FEE_DENOMINATOR
+    return adjusted_in * (reserve_out - amount_out) >= reserve_in * reserve_out
+
+
+def stream(swaps, seed, reserve):
+    rng = random.Random(seed)
+    for i in range(swaps // 2):
+        size = reserve * 10 ** rng.uniform(-8, -2)
+        yield rng.random() < 0.5, rng.random() < 0.5, round(size, rng.randint(2, 18))
+
+
+def swap(math, reserves, r_in, r_out, size, exact_out, check):
+    started = time.perf_counter()
+    if exact_out:
+        amount_out = size
+        amount_in = math.amount_in(amount_out, reserves[r_in], reserves[r_out])
+    else:
+        amount_in = size
+        amount_out = math.amount_out(amount_in, reserves[r_in], reserves[r_out])
+    elapsed = time.perf_counter() - started
+    ok = not check or k_holds(reserves[r_in], reserves[r_out], amount_in, amount_out)
+    reserves[r_in] = math.add(reserves[r_in], amount_in)
+    reserves[r_out] = math.sub(reserves[r_out], amount_out)
+    return amount_out, ok, elapsed
+
+
+def run(math, swaps, seed, reserve, check):
+    """Every stream entry is a round trip so the pool never drains: one swap
+    of the given size, then the output sold straight back."""
+    reserves = [math.convert(reserve), math.convert(reserve * 2)]
+    failures = 0
+    elapsed = 0
+    for zero_for_one, exact_out, size in stream(swaps, seed, reserve):
+        r_in, r_out = (0, 1) if zero_for_one else (1, 0)
+        amount_out, ok, spent = swap(math, reserves, r_in, r_out, math.convert(size), exact_out, check)
+        failures += not ok
+        elapsed += spent
+        amount_out, ok, spent = swap(math, reserves, r_out, r_in, amount_out, False, check)
+        failures += not ok
+        elapsed += spent
+    return reserves, failures, elapsed
+
+
+def run_contracts(swaps, seed, reserve):
+    """Exact input swaps from the stream through the deployed contracts, each
+    output checked against ContractMath on the reserves the pair reports."""
+    client = ContractingClient()
+    client.flush()
+
+    env = {"now": Datetime(year=2026, month=1, day=1)}
+    deadline = Datetime(year=2026, month=1, day=2)
+
+    # The metered executor charges stamps to the signer's currency balance
+    client.submit(TOKEN_CODE, name='currency')
+    client.submit(TOKEN_CODE, name='con_bench_token')
+    with open(os.path.join(HERE, 'con_pairs.py')) as f:
+        client.submit(f.read(), name='con_pairs')
+    with open(os.path.join(HERE, 'con_dex.py')) as f:
+        client.submit(f.read(), name='con_dex_v2')
+
+    pairs = client.get_contract('con_pairs')
+    dex = client.get_contract('con_dex_v2')
+    pairs.setRouter(router='con_dex_v2', enabled=True, signer='sys')
+
+    tokens = ('con_bench_token', 'currency')
+    for name in tokens:
+        client.get_contract(name).approve(amount=10 ** 9, to='con_dex_v2', signer='sys')
+    dex.addLiquidity(tokenA=tokens[0], tokenB=tokens[1], amountADesired=ContractingDecimal(repr(reserve)),
+                     amountBDesired=ContractingDecimal(repr(reserve * 2)), amountAMin=0, amountBMin=0,
+                     to='sys', deadline=deadline, signer='sys', environment=env)
+    pair = pairs.pairFor(tokenA=tokens[0], tokenB=tokens[1], signer='sys')
+
+    client.executor.metering = True
+
+    math = ContractMath()
+    mismatches = 0
+    stamps = []
+    for zero_for_one, exact_out, size in itertools.islice(stream(swaps * 2, seed, reserve), swaps):
+        reserve0, reserve1, timestamp = pairs.getReserves(pair=pair, signer='sys')
+        reserve_in, reserve_out = (reserve0, reserve1) if zero_for_one else (reserve1, reserve0)
+        amount_in = math.convert(size)
+        expected = math.amount_out(amount_in, Decimal(str(reserve_in)), Decimal(str(reserve_out)))
+
+        output = dex.swapExactTokenForToken(amountIn=ContractingDecimal(str(amount_in)), amountOutMin=0,
+                                            pair=pair, src=tokens[0] if zero_for_one else tokens[1],
+                                            to='sys', deadline=deadline, signer='sys', environment=env,
+                                            return_full_output=True)
+        assert output['status_code'] == 0, output['result']
+        mismatches += Decimal(str(output['result'])) != expected
+        stamps.append(output['stamps_used'])
+
+    return stamps, mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--swaps', type=int, default=1000000)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--reserve', type=float, default=1000000.0)
+    parser.add_argument('--contract-swaps', type=int, default=1000)
+    args = parser.parse_args()
+
+    results = {}
+    for math in (ReferenceMath(), ContractMath(), FloatMath()):
+        check = not isinstance(math, ReferenceMath)
+        results[math.name] = run(math, args.swaps, args.seed, args.reserve, check)
+
+    reference = results['reference'][0]
+    print('swaps: {}  seed: {}  starting reserves: {} / {}'.format(
+        args.swaps, args.seed, args.reserve, args.reserve * 2))
+    print('{:<10} {:>12} {:>14} {:>22} {:>22}'.format(
+        'path', 'us/swap', 'K rejected', 'reserve0 drift', 'reserve1 drift'))
+    for name in ('decimal', 'float'):
+        reserves, failures, elapsed = results[name]
+        drift = [abs(Decimal(repr(r)) - ref) / ref if name == 'float' else abs(r - ref) / ref
+                 for r, ref in zip(reserves, reference)]
+        print('{:<10} {:>12.2f} {:>14} {:>22.3E} {:>22.3E}'.format(
+            name, elapsed / args.swaps * 1e6, failures, drift[0], drift[1]))
+
+    if args.contract_swaps > 0:
+        stamps, mismatches = run_contracts(args.contract_swaps, args.seed, args.reserve)
+        print('contract swaps: {}  stamps/swap: {:.0f} mean, {} min, {} max  outputs off the decimal model: {}'.format(
+            len(stamps), sum(stamps) / len(stamps), min(stamps), max(stamps), mismatches))
+
+
+if __name__ == '__main__':
+    main()
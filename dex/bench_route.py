@@ -0,0 +1,107 @@
+"""Measure the stamps getBestRoute costs in its worst case.
+
+searchRoute looks the hop into the destination up directly and expands at
+most MAX_ROUTE_EDGES pairs of the source and of every intermediate token. The
+worst case gives every one of those a live pair: a source with E pairs to
+middle tokens, each middle token with E pairs to outer tokens, and the
+destination paired with the source, every middle and every outer token, so
+each direct lookup is quoted too. This builds that graph with E = --edges,
+sends getBestRoute through a metered ContractingClient for maxHops 1 to 3 and
+reports stamps_used. With --stable every pair is a StableSwap pair, so each
+quote also runs the Newton iterations of stableD and stableY.
+
+    python bench_route.py [--edges E] [--stable] [--dex PATH] [--pairs PATH]
+
+Building the graph takes E * E + 3 * E + 1 liquidity transactions.
+"""
+import argparse
+import datetime
+import os
+
+from contracting.client import ContractingClient
+from contracting.stdlib.bridge.time import Datetime
+
+from bench_conflicts import TOKEN_CODE
+
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+STABLE_FEE = 5
+STABLE_AMP = 100
+
+
+def run(pairs_path, dex_path, edges, stable):
+    client = ContractingClient()
+    client.flush()
+
+    now = Datetime._from_datetime(datetime.datetime(2026, 1, 1))
+    deadline = Datetime._from_datetime(datetime.datetime(2026, 1, 2))
+    env = {"now": now}
+
+    # The metered executor charges stamps to the signer's currency balance
+    client.submit(TOKEN_CODE, name='currency')
+    with open(pairs_path) as f:
+        client.submit(f.read(), name='con_pairs')
+    with open(dex_path) as f:
+        client.submit(f.read(), name='con_dex_v2')
+
+    pairs = client.get_contract('con_pairs')
+    dex = client.get_contract('con_dex_v2')
+    pairs.setRouter(router='con_dex_v2', enabled=True, signer='sys')
+
+    source = 'con_route_src'
+    destination = 'con_route_dst'
+    middle = ['con_route_mid_{:02d}'.format(i) for i in range(edges)]
+    outer = ['con_route_out_{:02d}'.format(i) for i in range(edges)]
+    for name in [source, destination] + middle + outer:
+        client.submit(TOKEN_CODE, name=name)
+        client.get_contract(name).approve(amount=10 ** 9, to='con_dex_v2', signer='sys')
+
+    fee, amp = (STABLE_FEE, STABLE_AMP) if stable else (30, 0)
+
+    def connect(token_a, token_b):
+        if token_b < token_a:
+            token_a, token_b = token_b, token_a
+        if stable:
+            pairs.createPair(tokenA=token_a, tokenB=token_b, fee=fee, amp=amp, signer='sys', environment=env)
+        dex.addLiquidity(tokenA=token_a, tokenB=token_b, amountADesired=10000, amountBDesired=10000,
+                         amountAMin=0, amountBMin=0, to='sys', deadline=deadline, fee=fee, amp=amp,
+                         signer='sys', environment=env)
+
+    # every token's first pairs are the ones the search expands
+    for token in middle:
+        connect(source, token)
+    for token in middle:
+        for other in outer:
+            connect(token, other)
+    for token in [source] + middle + outer:
+        connect(token, destination)
+
+    client.executor.metering = True
+
+    results = []
+    for max_hops in (1, 2, 3):
+        output = dex.getBestRoute(amountIn=10, src=source, dst=destination, maxHops=max_hops, signer='sys',
+                                  environment=env, return_full_output=True)
+        assert output['status_code'] == 0, output['result']
+        path, amounts = output['result']
+        results.append((max_hops, output['stamps_used'], len(path)))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pairs', default=os.path.join(HERE, 'con_pairs.py'))
+    parser.add_argument('--dex', default=os.path.join(HERE, 'con_dex.py'))
+    parser.add_argument('--edges', type=int, default=32)
+    parser.add_argument('--stable', action='store_true')
+    args = parser.parse_args()
+
+    print('edges per token: {}  curve: {}'.format(args.edges, 'StableSwap' if args.stable else 'constant product'))
+    print('{:<10} {:>14} {:>10}'.format('maxHops', 'stamps_used', 'hops'))
+    for max_hops, stamps, hops in run(args.pairs, args.dex, args.edges, args.stable):
+        print('{:<10} {:>14} {:>10}'.format(max_hops, stamps, hops))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,34 @@
 DEX_PAIRS = "con_pairs"
+MAX_HOPS = 3
+MAX_ROUTE_EDGES = 32
+AMOUNT_IN_ROUNDING = 0.000000000000000000000000000001 #round getAmountIn up by one unit
+FEE_BPS = 30 #default fee tier of con_pairs, 0.3%
+FEE_DENOMINATOR = 10000
+STABLE_ITERATIONS = 64 #must match con_pairs
+STABLE_PRECISION = 0.000000000000000000000001 #must match con_pairs
+STABLE_MARGIN = 0.00000000000000000001 #StableSwap quotes give up this share of the reserve to Newton rounding
 
 toks_to_pair = ForeignHash(foreign_contract=DEX_PAIRS, foreign_name='toks_to_pair')
 pairsmap = ForeignHash(foreign_contract=DEX_PAIRS, foreign_name='pairs')
+validTokens = ForeignHash(foreign_contract=DEX_PAIRS, foreign_name='validTokens')
+feelessTokens = ForeignHash(foreign_contract=DEX_PAIRS, foreign_name='feelessTokens')
+tok_pairs = ForeignHash(foreign_contract=DEX_PAIRS, foreign_name='tok_pairs')
+tok_pairs_num = ForeignHash(foreign_contract=DEX_PAIRS, foreign_name='tok_pairs_num')
+liqAllowances = ForeignHash(foreign_contract=DEX_PAIRS, foreign_name='liqAllowances')
+compactEvents = ForeignVariable(foreign_contract=DEX_PAIRS, foreign_name='compactEvents')
+
+#one event per multi-hop route in con_pairs compact mode, path and the amount
+#entering each hop (plus the final output) are comma separated
+RouteSwap = LogEvent(event="RouteSwap",
+	params={
+	"src":     {'type':str, 'idx':True},
+	"to":      {'type':str, 'idx':True},
+	"path":    {'type':str},
+	"amounts": {'type':str}
+	}
+)
+
+delegates = Hash(default_value=False)
 
 token_interface = [
     importlib.Func('transfer_from', args=('amount', 'to', 'main_account')),
@@ -10,13 +37,85 @@ token_interface = [
     #importlib.Var('balances', Hash),
 ]
 
+#signed approvals as in the Xian currency contract
+permit_interface = [
+    importlib.Func('permit', args=('owner', 'spender', 'value', 'deadline', 'signature')),
+]
+
 def PAIRS():
 	return importlib.import_module(DEX_PAIRS)
 
-def safeTransferFrom(token: str, src: str, to: str, value: float):
+#con_pairs keeps immutable pair metadata packed as [token0, token1, creationTime, fee, amp]
+def pairMeta(pair: int):
+	meta = pairsmap[pair, "meta"]
+	assert meta, 'SNAKX: NO_PAIR'
+	return meta
+
+#liquidity only goes into the curve the caller expects, the pair of a token pair
+#is created once and keeps its fee and amp
+def checkCurve(pair: int, fee: int, amp: int):
+	meta = pairMeta(pair)
+	assert meta[3] == fee and meta[4] == amp, 'SNAKX: CURVE_MISMATCH'
+	return meta
+
+def pairTokens(pair: int):
+	meta = pairMeta(pair)
+	return meta[0], meta[1]
+
+def pathDestination(src: str, path: list):
+	for x in range(0, len(path)):
+		tok0, tok1 = pairTokens(path[x])
+		src = tok1 if src == tok0 else tok0
+	return src
+
+#con_pairs registers every token that passed token_interface in createPair
+def tokenContract(token: str):
 	t = importlib.import_module(token)
-	assert importlib.enforce_interface(t, token_interface)
-	t.transfer_from(value, to, src)
+	if not validTokens[token]:
+		assert importlib.enforce_interface(t, token_interface), 'SNAKX: NO_TOKEN'
+	return t
+
+#lets a contract such as con_dex_helper trade on the caller's behalf, pulling
+#straight from the caller's router allowance instead of custodying the tokens
+@export
+def setDelegate(delegate: str, enabled: bool):
+	delegates[ctx.caller, delegate] = enabled
+
+#swaps pull from ctx.caller unless a payer that delegated to ctx.caller is given
+def payerFor(payer: str):
+	if payer == None or payer == ctx.caller:
+		return ctx.caller
+	assert delegates[payer, ctx.caller], 'SNAKX: NOT_DELEGATE'
+	return payer
+
+#moves tokens from src into con_pairs and credits what actually arrived to the pair,
+#src can be the router itself for tokens it holds mid-call (zaps)
+def safeTransferToPair(token: str, src: str, pair: int, value: float):
+	t = tokenContract(token)
+	feeless = feelessTokens[token]
+	
+	if not feeless:
+		balanceBefore = t.balance_of(DEX_PAIRS)
+		if(balanceBefore == None):
+			balanceBefore = 0
+	
+	if src == ctx.this:
+		t.transfer(value, DEX_PAIRS)
+	else:
+		t.transfer_from(value, DEX_PAIRS, src)
+	
+	received = value
+	if not feeless:
+		received = t.balance_of(DEX_PAIRS) - balanceBefore
+	PAIRS().credit(pair, token, received)
+	return received
+
+#what the router holds of a token, read around transfers to it that may be taxed
+def routerBalance(token: str):
+	balance = tokenContract(token).balance_of(ctx.this)
+	if(balance == None):
+		balance = 0
+	return balance
 	
 def quote(amountA: float, reserveA: float, reserveB: float):
 	assert amountA > 0, 'SNAKX: INSUFFICIENT_AMOUNT'
@@ -30,13 +129,26 @@ tokenB: str,
 amountADesired: float,
 amountBDesired: float,
 amountAMin: float,
-amountBMin: float):
+amountBMin: float,
+fee: int,
+amp: int):
 	pairs = PAIRS()
 	
 	desired_pair = toks_to_pair[tokenA, tokenB]
 	if (desired_pair == None):
-		desired_pair = pairs.createPair(tokenA, tokenB)
-	reserveA, reserveB, ignore = pairs.getReserves(desired_pair)
+		desired_pair = pairs.createPair(tokenA, tokenB, fee, amp)
+	else:
+		checkCurve(desired_pair, fee, amp)
+	return pairAmounts(desired_pair, amountADesired, amountBDesired, amountAMin, amountBMin)
+
+#amounts to deposit into a pair at its current ratio, tokenA is the pair's token0
+def pairAmounts(
+pair: int,
+amountADesired: float,
+amountBDesired: float,
+amountAMin: float,
+amountBMin: float):
+	reserveA, reserveB, ignore = PAIRS().getReserves(pair)
 
 	if (reserveA == 0 and reserveB == 0):
 		return amountADesired, amountBDesired
@@ -62,20 +174,21 @@ def addLiquidity(
 	amountAMin: float,
 	amountBMin: float,
 	to: str,
-	deadline: datetime.datetime
+	deadline: datetime.datetime,
+	fee: int = FEE_BPS,
+	amp: int = 0
 ):
 	assert now < deadline, 'SNAKX: EXPIRED'
 	pairs = PAIRS()
 	
 	if(tokenB < tokenA):
 		tokenA, tokenB = tokenB, tokenA
-	amountA, amountB = internal_addLiquidity(tokenA, tokenB, amountADesired, amountBDesired, amountAMin, amountBMin)
+	amountA, amountB = internal_addLiquidity(tokenA, tokenB, amountADesired, amountBDesired, amountAMin, amountBMin, fee, amp)
 
 	pair = toks_to_pair[tokenA, tokenB]
 	
-	safeTransferFrom(tokenA, ctx.caller, DEX_PAIRS, amountA);
-	safeTransferFrom(tokenB, ctx.caller, DEX_PAIRS, amountB);
-	pairs.sync2(pair)
+	safeTransferToPair(tokenA, ctx.caller, pair, amountA);
+	safeTransferToPair(tokenB, ctx.caller, pair, amountB);
 	
 	liquidity = pairs.mint(pair, to)
 	
@@ -99,41 +212,343 @@ def removeLiquidity(
 	assert desired_pair != None, "SNAKX: NO_PAIR"
 #liqTransfer_from(desired_pair, liquidity, ctx.this, ctx.caller)
 	pairs.liqTransfer_from(desired_pair, liquidity, DEX_PAIRS, ctx.caller)
-	pairs.sync2(desired_pair)
 	amountA, amountB = pairs.burn(desired_pair, to)
 	assert amountA >= amountAMin, 'SNAKX: INSUFFICIENT_A_AMOUNT'
 	assert amountB >= amountBMin, 'SNAKX: INSUFFICIENT_B_AMOUNT'
 	
 	return amountA, amountB
 	
+#removeLiquidity without a prior liqApprove: signature is the caller's con_pairs
+#liqPermit for this router over exactly liquidity, valid until deadline. liqPermit
+#is open to anyone, so when someone already submitted the signature the
+#allowance it set is used as is
 @export
-def getAmountOut(amountIn: float, reserveIn: float, reserveOut: float):
+def removeLiquidityWithPermit(
+	tokenA: str,
+	tokenB: str,
+	liquidity: float,
+	amountAMin: float,
+	amountBMin: float,
+	to: str,
+	deadline: datetime.datetime,
+	signature: str
+):
+	desired_pair = toks_to_pair[tokenA, tokenB]
+	assert desired_pair != None, "SNAKX: NO_PAIR"
+	if liqAllowances[desired_pair, ctx.caller, ctx.this] < liquidity:
+		PAIRS().liqPermit(desired_pair, ctx.caller, ctx.this, liquidity, deadline, signature)
+	return removeLiquidity(tokenA, tokenB, liquidity, amountAMin, amountBMin, to, deadline)
+
+#many deposits in one transaction, positions is a list of
+#[pair, amount0Desired, amount1Desired, amount0Min, amount1Min, fee, amp] in pair
+#token order with the fee and amp each pair is expected to have.
+#Feeless tokens are pulled once per token for all positions, taxed ones pair by pair
+@export
+def addLiquidityMany(positions: list, to: str, deadline: datetime.datetime):
+	assert now < deadline, 'SNAKX: EXPIRED'
+	assert len(positions) >= 1, 'SNAKX: INVALID_LENGTHS'
+	pairs = PAIRS()
+	
+	deposits = []
+	totals = {}
+	for position in positions:
+		pair, amount0Desired, amount1Desired, amount0Min, amount1Min, fee, amp = position
+		tok0, tok1 = checkCurve(pair, fee, amp)[0:2]
+		amount0, amount1 = pairAmounts(pair, amount0Desired, amount1Desired, amount0Min, amount1Min)
+		deposits.append([pair, tok0, tok1, amount0, amount1])
+		if feelessTokens[tok0]:
+			totals[tok0] = totals.get(tok0, 0) + amount0
+		if feelessTokens[tok1]:
+			totals[tok1] = totals.get(tok1, 0) + amount1
+	
+	for token in totals:
+		tokenContract(token).transfer_from(totals[token], DEX_PAIRS, ctx.caller)
+	
+	results = []
+	for deposit in deposits:
+		pair, tok0, tok1, amount0, amount1 = deposit
+		if feelessTokens[tok0]:
+			pairs.credit(pair, tok0, amount0)
+		else:
+			safeTransferToPair(tok0, ctx.caller, pair, amount0)
+		if feelessTokens[tok1]:
+			pairs.credit(pair, tok1, amount1)
+		else:
+			safeTransferToPair(tok1, ctx.caller, pair, amount1)
+		results.append([amount0, amount1, pairs.mint(pair, to)])
+	
+	return results
+
+#many withdrawals in one transaction, positions is a list of
+#[pair, liquidity, amount0Min, amount1Min] with every pair at most once,
+#con_pairs.burnMany nets the payouts
+@export
+def removeLiquidityMany(positions: list, to: str, deadline: datetime.datetime):
+	assert now < deadline, 'SNAKX: EXPIRED'
+	assert len(positions) >= 1, 'SNAKX: INVALID_LENGTHS'
+	pairs = PAIRS()
+	
+	pairIds = []
+	for position in positions:
+		pair, liquidity, amount0Min, amount1Min = position
+		assert pair not in pairIds, 'SNAKX: DUPLICATE_PAIR'
+		pairs.liqTransfer_from(pair, liquidity, DEX_PAIRS, ctx.caller)
+		pairIds.append(pair)
+	
+	amounts = pairs.burnMany(pairIds, to)
+	for x in range(0, len(positions)):
+		assert amounts[x][0] >= positions[x][2], 'SNAKX: INSUFFICIENT_A_AMOUNT'
+		assert amounts[x][1] >= positions[x][3], 'SNAKX: INSUFFICIENT_B_AMOUNT'
+	
+	return amounts
+
+#part of a single-token deposit to swap so the rest matches the pool ratio after the swap.
+#Constant product: (sqrt(r*(r*(1+g)^2 + 4*g*a)) - r*(1+g)) / (2*g) with g the input share
+#kept after the fee. StableSwap pairs trade near 1:1, where a*rOut/(a+rIn+rOut) balances
+def zapSwapAmount(amount: float, reserveIn: float, reserveOut: float, fee: int, amp: int):
+	if (amp > 0):
+		return amount * reserveOut / (amount + reserveIn + reserveOut)
+	reserveInWithFee = reserveIn * (FEE_DENOMINATOR - fee) / FEE_DENOMINATOR
+	amountWithFee = amount * (FEE_DENOMINATOR - fee) / FEE_DENOMINATOR
+	b = reserveIn + reserveInWithFee
+	return ((b * b + reserveIn * amountWithFee * 4) ** 0.5 - b) * reserveIn / (reserveInWithFee * 2)
+
+#provides liquidity from a single token: swaps part of amount for the other token and
+#deposits both at the pool ratio. Whatever of the swapped token does not fit goes to to,
+#the unused rest of amount is never pulled from the payer. fee and amp are the
+#curve the caller expects the pair to have
+@export
+def zapIn(
+	pair: int,
+	token: str,
+	amount: float,
+	minLiquidity: float,
+	to: str,
+	deadline: datetime.datetime,
+	payer: str = None,
+	fee: int = FEE_BPS,
+	amp: int = 0
+):
+	assert now < deadline, 'SNAKX: EXPIRED'
+	assert amount > 0, 'SNAKX: INSUFFICIENT_INPUT_AMOUNT'
+	pairs = PAIRS()
+	src = payerFor(payer)
+	tok0, tok1 = checkCurve(pair, fee, amp)[0:2]
+	assert token == tok0 or token == tok1, 'SNAKX: INVALID_TOKEN'
+	order = (token == tok0)
+	other = tok1 if order else tok0
+
+	reserveIn, reserveOut, ignore = pairs.getReserves(pair)
+	if(not order):
+		reserveIn, reserveOut = reserveOut, reserveIn
+	assert reserveIn > 0 and reserveOut > 0, 'SNAKX: INSUFFICIENT_LIQUIDITY'
+
+	swapIn = zapSwapAmount(amount, reserveIn, reserveOut, fee, amp)
+	credited = safeTransferToPair(token, src, pair, swapIn)
+	swapOut = getAmountOut(credited, reserveIn, reserveOut, fee, amp)
+
+	feeless = feelessTokens[other]
+	if not feeless:
+		balanceBefore = routerBalance(other)
+	pairs.swap(pair, 0 if order else swapOut, swapOut if order else 0, ctx.this)
+	received = swapOut
+	if not feeless:
+		received = routerBalance(other) - balanceBefore
+
+	reserveIn = reserveIn + credited
+	reserveOut = reserveOut - swapOut
+	amountIn = amount - swapIn
+	amountOther = quote(amountIn, reserveIn, reserveOut)
+	if (amountOther > received):
+		amountOther = received
+		amountIn = quote(received, reserveOut, reserveIn)
+
+	safeTransferToPair(token, src, pair, amountIn)
+	safeTransferToPair(other, ctx.this, pair, amountOther)
+	if (received > amountOther):
+		tokenContract(other).transfer(received - amountOther, to)
+
+	liquidity = pairs.mint(pair, to)
+	assert liquidity >= minLiquidity, 'SNAKX: INSUFFICIENT_LIQUIDITY_MINTED'
+	return liquidity
+
+#burns liquidity and swaps the other token's share so to receives only token
+@export
+def zapOut(
+	pair: int,
+	liquidity: float,
+	token: str,
+	amountOutMin: float,
+	to: str,
+	deadline: datetime.datetime
+):
+	assert now < deadline, 'SNAKX: EXPIRED'
+	pairs = PAIRS()
+	tok0, tok1, ignore, fee, amp = pairMeta(pair)
+	assert token == tok0 or token == tok1, 'SNAKX: INVALID_TOKEN'
+	order = (token == tok0)
+	other = tok1 if order else tok0
+
+	feelessToken = feelessTokens[token]
+	feelessOther = feelessTokens[other]
+	if not feelessToken:
+		tokenBefore = routerBalance(token)
+	if not feelessOther:
+		otherBefore = routerBalance(other)
+
+	pairs.liqTransfer_from(pair, liquidity, DEX_PAIRS, ctx.caller)
+	amount0, amount1 = pairs.burn(pair, ctx.this)
+	amountOut = amount0 if order else amount1
+	amountOther = amount1 if order else amount0
+	if not feelessToken:
+		amountOut = routerBalance(token) - tokenBefore
+	if not feelessOther:
+		amountOther = routerBalance(other) - otherBefore
+
+	reserveOut, reserveIn, ignore = pairs.getReserves(pair)
+	if(not order):
+		reserveIn, reserveOut = reserveOut, reserveIn
+	credited = safeTransferToPair(other, ctx.this, pair, amountOther)
+	swapOut = getAmountOut(credited, reserveIn, reserveOut, fee, amp)
+	t = tokenContract(token)
+	if not feelessToken:
+		toBefore = t.balance_of(to)
+		if(toBefore == None):
+			toBefore = 0
+	pairs.swap(pair, swapOut if order else 0, 0 if order else swapOut, to)
+	t.transfer(amountOut, to)
+
+	#a taxed token loses part of both transfers to to, count what arrived
+	amountOut = amountOut + swapOut
+	if not feelessToken:
+		amountOut = t.balance_of(to) - toBefore
+	assert amountOut >= amountOutMin, 'SNAKX: INSUFFICIENT_OUTPUT_AMOUNT'
+	return amountOut
+
+#StableSwap invariant D for two coins, same iteration as con_pairs.stableD
+def stableD(x0: float, x1: float, amp: int):
+	S = x0 + x1
+	if (S == 0):
+		return 0
+	D = S
+	Ann = amp * 4
+	for i in range(STABLE_ITERATIONS):
+		D_P = D * D / (x0 * 2) * D / (x1 * 2)
+		DPrev = D
+		D = (Ann * S + D_P * 2) / ((Ann - 1) * D + D_P * 3) * D
+		if (abs(D - DPrev) <= D * STABLE_PRECISION):
+			return D
+	assert False, 'SNAKX: NO_CONVERGENCE'
+
+#balance of one coin that keeps D when the other coin's balance is x
+def stableY(x: float, D: float, amp: int):
+	Ann = amp * 4
+	c = D * D / (x * 2) * D / (Ann * 2)
+	b = x + D / Ann
+	y = D
+	for i in range(STABLE_ITERATIONS):
+		yPrev = y
+		y = (y * y + c) / (y * 2 + b - D)
+		if (abs(y - yPrev) <= y * STABLE_PRECISION):
+			return y
+	assert False, 'SNAKX: NO_CONVERGENCE'
+
+#fee-free marginal price of a hop, reserveOut per reserveIn
+def spotPrice(reserveIn: float, reserveOut: float, amp: int):
+	if (amp == 0):
+		return reserveOut / reserveIn
+	D = stableD(reserveIn, reserveOut, amp)
+	Ann = amp * 4
+	t = D / (reserveIn * 2) * D / (reserveOut * 2) * D
+	return (Ann + t / reserveIn) / (Ann + t / reserveOut)
+
+@export
+def getAmountOut(amountIn: float, reserveIn: float, reserveOut: float, fee: int = FEE_BPS, amp: int = 0):
 	assert amountIn > 0, 'SNAKX: INSUFFICIENT_INPUT_AMOUNT'
 	assert reserveIn > 0 and reserveOut > 0, 'SNAKX: INSUFFICIENT_LIQUIDITY'
-	amountInWithFee = amountIn * 0.997;
+	amountInWithFee = amountIn * (FEE_DENOMINATOR - fee) / FEE_DENOMINATOR;
+	if (amp > 0):
+		y = stableY(reserveIn + amountInWithFee, stableD(reserveIn, reserveOut, amp), amp)
+		return max(reserveOut - y - reserveOut * STABLE_MARGIN, 0)
 	numerator = amountInWithFee * reserveOut;
 	denominator = reserveIn + amountInWithFee;
 	return numerator / denominator
-#(x*997*y)/(z*1000+997*x) = (x*0.997*y)/(z+0.997*x)
+#(x*(10000-fee)*y)/(z*10000+(10000-fee)*x), every step rounds down
 	
-@export
-def getAmountsOut(amountIn: float, src: str, path: list):
+#reserves oriented along the path, [reserveIn, reserveOut, fee, amp] for every hop
+def pathReserves(src: str, path: list):
 	assert len(path) >= 1, 'SNAKX: INVALID_PATH'
-	pairs = PAIRS()
-	amounts = [amountIn]
+	infos = PAIRS().getReservesMany(path)
+	reserves = []
 	
 	for x in range(0, len(path)):
-		tok0 = pairsmap[path[x], "token0"]
+		tok0 = infos[x]["token0"]
 		
 		order = (src == tok0)
 		
-		reserveIn, reserveOut, ignore = pairs.getReserves(path[x])
+		reserveIn, reserveOut = infos[x]["reserve0"], infos[x]["reserve1"]
 		if(not order):
 			reserveIn, reserveOut = reserveOut, reserveIn
 		
-		src = pairsmap[path[x], "token1"] if order else tok0
-			
-		amounts.append(getAmountOut(amounts[x], reserveIn, reserveOut))
+		src = infos[x]["token1"] if order else tok0
+		
+		reserves.append([reserveIn, reserveOut, infos[x]["fee"], infos[x]["amp"]])
+		
+	return reserves
+	
+@export
+def getAmountsOut(amountIn: float, src: str, path: list):
+	reserves = pathReserves(src, path)
+	amounts = [amountIn]
+	
+	for x in range(0, len(path)):
+		amounts.append(getAmountOut(amounts[x], reserves[x][0], reserves[x][1], reserves[x][2], reserves[x][3]))
+		
+	return amounts
+	
+#output ladder for many input sizes with reserves read once, priceImpact is
+#the shortfall against the fee-free mid price of the path (so it includes fees)
+@export
+def getAmountsOutLadder(sizes: list, src: str, path: list):
+	reserves = pathReserves(src, path)
+	
+	midPrice = 1
+	for x in range(0, len(path)):
+		assert reserves[x][0] > 0 and reserves[x][1] > 0, 'SNAKX: INSUFFICIENT_LIQUIDITY'
+		midPrice = midPrice * spotPrice(reserves[x][0], reserves[x][1], reserves[x][3])
+	
+	ladder = []
+	for amountIn in sizes:
+		amountOut = amountIn
+		for x in range(0, len(path)):
+			amountOut = getAmountOut(amountOut, reserves[x][0], reserves[x][1], reserves[x][2], reserves[x][3])
+		ladder.append({
+			"amountIn": amountIn,
+			"amountOut": amountOut,
+			"priceImpact": 1 - (amountOut / (amountIn * midPrice))
+		})
+		
+	return ladder
+	
+@export
+def getAmountIn(amountOut: float, reserveIn: float, reserveOut: float, fee: int = FEE_BPS, amp: int = 0):
+	assert amountOut > 0, 'SNAKX: INSUFFICIENT_OUTPUT_AMOUNT'
+	assert reserveIn > 0 and reserveOut > amountOut, 'SNAKX: INSUFFICIENT_LIQUIDITY'
+	if (amp > 0):
+		x = stableY(reserveOut - amountOut, stableD(reserveIn, reserveOut, amp), amp)
+		return (x - reserveIn + reserveIn * STABLE_MARGIN) * FEE_DENOMINATOR / (FEE_DENOMINATOR - fee)
+	numerator = reserveIn * amountOut;
+	denominator = (reserveOut - amountOut) * (FEE_DENOMINATOR - fee) / FEE_DENOMINATOR;
+	#the product and the quotient both round down, undo both so the K check holds
+	return ((numerator + AMOUNT_IN_ROUNDING) / denominator) + AMOUNT_IN_ROUNDING
+	
+@export
+def getAmountsIn(amountOut: float, src: str, path: list):
+	reserves = pathReserves(src, path)
+	amounts = [amountOut]
+	
+	for x in range(len(path) - 1, -1, -1):
+		amounts.insert(0, getAmountIn(amounts[0], reserves[x][0], reserves[x][1], reserves[x][2], reserves[x][3]))
 		
 	return amounts
 
@@ -144,18 +559,19 @@ def swapExactTokenForToken(
 	pair: int,
 	src: str,
 	to: str,
-	deadline: datetime.datetime
+	deadline: datetime.datetime,
+	payer: str = None
 ):
 	assert now < deadline, 'SNAKX: EXPIRED'
 	pairs = PAIRS()
 	reserve0, reserve1, ignore = pairs.getReserves(pair)
-	order = (src == pairsmap[pair, "token0"])
+	tok0, tok1, ignore, fee, amp = pairMeta(pair)
+	order = (src == tok0)
 	if(not order):
 		reserve0, reserve1 = reserve1, reserve0
-	amount = getAmountOut(amountIn, reserve0, reserve1)
+	amount = getAmountOut(amountIn, reserve0, reserve1, fee, amp)
 	assert amount >= amountOutMin, 'SNAKX: INSUFFICIENT_OUTPUT_AMOUNT'
-	safeTransferFrom(src, ctx.caller, DEX_PAIRS, amountIn)
-	pairs.sync2(pair)
+	safeTransferToPair(src, payerFor(payer), pair, amountIn)
 	out0 = 0 if order else amount
 	out1 = amount if order else 0
 	pairs.swap(pair, out0, out1, to)
@@ -169,22 +585,24 @@ def swapExactTokenForTokenSupportingFeeOnTransferTokens(
 	pair: int,
 	src: str,
 	to: str,
-	deadline: datetime.datetime
+	deadline: datetime.datetime,
+	payer: str = None
 ):
-	assert now < deadline, 'SNAKX: EXPIRED'
-	pairs = PAIRS()
-	
-	TOK0 = pairsmap[pair, "token0"]
+	TOK0, TOK1, ignore, fee, amp = pairMeta(pair)
 	
 	order = (src == TOK0)
 	
-	t = importlib.import_module(TOK0 if not order else pairsmap[pair, "token1"])
-	assert importlib.enforce_interface(t, token_interface)
+	if feelessTokens[src] and feelessTokens[TOK0 if not order else TOK1]:
+		return swapExactTokenForToken(amountIn, amountOutMin, pair, src, to, deadline, payer)
+	
+	assert now < deadline, 'SNAKX: EXPIRED'
+	pairs = PAIRS()
+	
+	t = tokenContract(TOK0 if not order else TOK1)
 	
 	balanceBefore = t.balance_of(to)
 	
-	safeTransferFrom(src, ctx.caller, DEX_PAIRS, amountIn)
-	pairs.sync2(pair)
+	safeTransferToPair(src, payerFor(payer), pair, amountIn)
 	
 	reserve0, reserve1, ignore = pairs.getReserves(pair)
 	sur0, sur1 = pairs.getSurplus(pair)
@@ -192,7 +610,7 @@ def swapExactTokenForTokenSupportingFeeOnTransferTokens(
 	if(not order):
 		reserve0, reserve1 = reserve1, reserve0
 	
-	amount = getAmountOut(sur0 if order else sur1, reserve0, reserve1)
+	amount = getAmountOut(sur0 if order else sur1, reserve0, reserve1, fee, amp)
 	
 	out0 = 0 if order else amount
 	out1 = amount if order else 0
@@ -205,58 +623,24 @@ def swapExactTokenForTokenSupportingFeeOnTransferTokens(
 	
 def internal_swap(amounts: list[float], src: str, path: list[int], to: str):
 	assert len(amounts) == len(path) + 1, 'SNAKX: INVALID_LENGTHS'
-	pairs = PAIRS()
-	
-	for x in range(0, len(path)-1):
-		tok0 = pairsmap[path[x], "token0"]
-		
-		order = (src == tok0)
-		
-		out0 = 0 if order else amounts[x+1]
-		out1 = amounts[x+1] if order else 0
-		
-		src = pairsmap[path[x], "token1"] if order else tok0
-			
-		pairs.swapToPair(path[x], out0, out1, path[x+1])
-		
-		
-	tok0 = pairsmap[path[-1], "token0"]
-	order = (src == tok0)
-		
-	out0 = 0 if order else amounts[-1]
-	out1 = amounts[-1] if order else 0
-			
-	pairs.swap(path[-1], out0, out1, to)
+	PAIRS().swapPath(path, amounts, src, to)
+	routeSwapped(amounts, src, path, to)
+
+def routeSwapped(amounts: list[float], src: str, path: list[int], to: str):
+	if len(path) > 1 and compactEvents.get():
+		RouteSwap({"src": src, "to": to,
+			"path": ",".join([str(pair) for pair in path]),
+			"amounts": ",".join([str(amount) for amount in amounts])})
 	
 def internal_swap_fee(amounts: list[float], amountOutMin: float, src: str, path: list[int], to: str):
 	assert len(amounts) == len(path) + 1, 'SNAKX: INVALID_LENGTHS'
-	pairs = PAIRS()
-	
-	for x in range(0, len(path)-1):
-		tok0 = pairsmap[path[x], "token0"]
-		
-		order = (src == tok0)
-		
-		out0 = 0 if order else amounts[x+1]
-		out1 = amounts[x+1] if order else 0
-		
-		src = pairsmap[path[x], "token1"] if order else tok0
-			
-		pairs.swapToPair(path[x], out0, out1, path[x+1])
-		
-		
-	tok0 = pairsmap[path[-1], "token0"]
-	order = (src == tok0)
 	
-	t = importlib.import_module(tok0 if not order else pairsmap[path[-1], "token1"])
-	assert importlib.enforce_interface(t, token_interface)
+	t = tokenContract(pathDestination(src, path))
 	
 	balanceBefore = t.balance_of(to)
-		
-	out0 = 0 if order else amounts[-1]
-	out1 = amounts[-1] if order else 0
-			
-	pairs.swap(path[-1], out0, out1, to)
+	
+	PAIRS().swapPath(path, amounts, src, to)
+	routeSwapped(amounts, src, path, to)
 	
 	rv = t.balance_of(to) - balanceBefore
 	assert rv >= amountOutMin, "SNAKX: INSUFFICIENT_OUTPUT_AMOUNT"
@@ -269,21 +653,24 @@ def swapExactTokensForTokensSupportingFeeOnTransferTokens(
 	path: list,
 	src: str,
 	to: str,
-	deadline: datetime.datetime
+	deadline: datetime.datetime,
+	payer: str = None
 ):
 	if len(path) == 1:
-		swapExactTokenForTokenSupportingFeeOnTransferTokens(amountIn, amountOutMin, path[0], src, to, deadline)
-		return
+		return swapExactTokenForTokenSupportingFeeOnTransferTokens(amountIn, amountOutMin, path[0], src, to, deadline, payer)
+	
+	#intermediate hops never move tokens, only the two ends can skim a fee
+	if feelessTokens[src] and feelessTokens[pathDestination(src, path)]:
+		return swapExactTokensForTokens(amountIn, amountOutMin, path, src, to, deadline, payer)
 	
 	assert now < deadline, 'SNAKX: EXPIRED'
 	pairs = PAIRS()
 	
-	TOK0 = pairsmap[path[0], "token0"]
+	TOK0, TOK1 = pairTokens(path[0])
 	
 	order = (src == TOK0)
 	
-	safeTransferFrom(src, ctx.caller, DEX_PAIRS, amountIn)
-	pairs.sync2(path[0])
+	safeTransferToPair(src, payerFor(payer), path[0], amountIn)
 	
 	sur0, sur1 = pairs.getSurplus(path[0])
 	
@@ -300,7 +687,8 @@ def swapExactTokensForTokens(
 	path: list,
 	src: str,
 	to: str,
-	deadline: datetime.datetime
+	deadline: datetime.datetime,
+	payer: str = None
 ):
 	assert now < deadline, 'SNAKX: EXPIRED'
 	pairs = PAIRS()
@@ -308,8 +696,121 @@ def swapExactTokensForTokens(
 	amounts = getAmountsOut(amountIn, src, path)
 	assert amounts[-1] >= amountOutMin, 'SNAKX: INSUFFICIENT_OUTPUT_AMOUNT'
 
-	safeTransferFrom(src, ctx.caller, DEX_PAIRS, amountIn)
-	pairs.sync2(path[0])
+	safeTransferToPair(src, payerFor(payer), path[0], amountIn)
 	internal_swap(amounts, src, path, to)
 	
 	return amounts[-1]
+
+#approve and trade in one transaction for tokens with permit: signature is the
+#caller's permit for this router over exactly amountIn with this deadline
+@export
+def swapExactTokensForTokensWithPermit(
+	amountIn: float,
+	amountOutMin: float,
+	path: list,
+	src: str,
+	to: str,
+	deadline: datetime.datetime,
+	signature: str
+):
+	t = tokenContract(src)
+	assert importlib.enforce_interface(t, permit_interface), 'SNAKX: NO_PERMIT'
+	t.permit(ctx.caller, ctx.this, amountIn, str(deadline), signature)
+	return swapExactTokensForTokensSupportingFeeOnTransferTokens(amountIn, amountOutMin, path, src, to, deadline)
+	
+@export
+def swapTokensForExactTokens(
+	amountOut: float,
+	amountInMax: float,
+	path: list,
+	src: str,
+	to: str,
+	deadline: datetime.datetime,
+	payer: str = None
+):
+	assert now < deadline, 'SNAKX: EXPIRED'
+	
+	amounts = getAmountsIn(amountOut, src, path)
+	assert amounts[0] <= amountInMax, 'SNAKX: EXCESSIVE_INPUT_AMOUNT'
+	
+	safeTransferToPair(src, payerFor(payer), path[0], amounts[0])
+	internal_swap(amounts, src, path, to)
+	
+	return amounts[0]
+	
+#quote for one hop of a route, 0 when the pair is empty
+def hopOut(amountIn: float, pair: int, src: str, other: str, fee: int, amp: int):
+	state = pairsmap[pair, "state"]
+	reserveIn, reserveOut = state[0], state[1]
+	if(other < src):
+		reserveIn, reserveOut = reserveOut, reserveIn
+	if reserveIn <= 0 or reserveOut <= 0:
+		return 0
+	return getAmountOut(amountIn, reserveIn, reserveOut, fee, amp)
+
+#depth first over the per-token pair index. The hop into dst is looked up
+#directly so late pairs of hub tokens are never missed, only the expansion of
+#intermediate tokens is capped at their first MAX_ROUTE_EDGES pairs. With E
+#that cap a search quotes at most 1 + E hops for maxHops 2 and 1 + E + E*(1 + 2E)
+#(2113) for maxHops 3, every stable hop adding its Newton iterations.
+#bench_route.py builds that graph and reports its stamps
+def searchRoute(amountIn: float, src: str, dst: str, hopsLeft: int, visited: list):
+	best = [0, []]
+	
+	tokenA, tokenB = (src, dst) if src < dst else (dst, src)
+	direct = toks_to_pair[tokenA, tokenB]
+	if direct != None:
+		fee, amp = pairMeta(direct)[3:5]
+		amountOut = hopOut(amountIn, direct, src, dst, fee, amp)
+		if amountOut > 0:
+			best = [amountOut, [direct]]
+	
+	if hopsLeft <= 1:
+		return best
+	
+	n = min(tok_pairs_num[src], MAX_ROUTE_EDGES)
+	for i in range(0, n):
+		pair, other, fee, amp = tok_pairs[src, i]
+		if other in visited or other == dst:
+			continue
+		
+		amountOut = hopOut(amountIn, pair, src, other, fee, amp)
+		if amountOut <= 0:
+			continue
+		sub = searchRoute(amountOut, other, dst, hopsLeft - 1, visited + [other])
+		if sub[0] > best[0]:
+			best = [sub[0], [pair] + sub[1]]
+	
+	return best
+
+@export
+def getBestRoute(amountIn: float, src: str, dst: str, maxHops: int = 2):
+	assert amountIn > 0, 'SNAKX: INSUFFICIENT_INPUT_AMOUNT'
+	assert src != dst, 'SNAKX: IDENTICAL_ADDRESSES'
+	assert maxHops >= 1 and maxHops <= MAX_HOPS, 'SNAKX: INVALID_HOPS'
+	
+	amountOut, path = searchRoute(amountIn, src, dst, maxHops, [src])
+	assert len(path) > 0, 'SNAKX: NO_ROUTE'
+	
+	return path, getAmountsOut(amountIn, src, path)
+
+@export
+def swapExactTokensForTokensBestRoute(
+	amountIn: float,
+	amountOutMin: float,
+	src: str,
+	dst: str,
+	maxHops: int,
+	to: str,
+	deadline: datetime.datetime,
+	payer: str = None
+):
+	assert now < deadline, 'SNAKX: EXPIRED'
+	
+	path, amounts = getBestRoute(amountIn, src, dst, maxHops)
+	assert amounts[-1] >= amountOutMin, 'SNAKX: INSUFFICIENT_OUTPUT_AMOUNT'
+	
+	safeTransferToPair(src, payerFor(payer), path[0], amountIn)
+	internal_swap(amounts, src, path, to)
+	
+	return path, amounts[-1]
@@ -3,6 +3,7 @@ DEX_PAIRS = "con_pairs"
 
 toks_to_pair = ForeignHash(foreign_contract=DEX_PAIRS, foreign_name='toks_to_pair')
 pairs = ForeignHash(foreign_contract=DEX_PAIRS, foreign_name='pairs')
+feeless_tokens = ForeignHash(foreign_contract=DEX_PAIRS, foreign_name='feelessTokens')
 
 def build_deadline(minutes_from_now: float):
     assert minutes_from_now > 0, "Deadline minutes must be positive"
@@ -10,66 +11,162 @@ def build_deadline(minutes_from_now: float):
     assert total_seconds > 0, "Deadline must be at least one second in the future"
     return now + datetime.timedelta(seconds=total_seconds)
 
-@export
-def buy(
-    buy_token: str, 
-    sell_token: str, 
-    amount: float, 
-    slippage: float = 1, 
-    deadline_min: float = 1
-):
-    assert amount > 0, "Amount must be positive"
-    assert 0 <= slippage <= 100, "Slippage must be between 0 and 100%"
-    
+def take_custody(sell_token: str, amount: float, direct: bool):
+    # Direct mode lets the router pull from the caller's own allowance into
+    # the pair, skipping the hop through this contract. It requires the caller
+    # to have approved DEX_CONTRACT and called setDelegate on it for this helper.
+    if direct:
+        return ctx.caller
+
+    sell_token_contract = importlib.import_module(sell_token)
+    sell_token_contract.transfer_from(
+        amount=amount, 
+        to=ctx.this, 
+        main_account=ctx.caller
+    )
+
+    sell_token_contract.approve(amount=amount, to=DEX_CONTRACT)
+
+    return ctx.this
+
+def path_destination(src: str, path: list):
+    for pair_id in path:
+        meta = pairs[pair_id, "meta"]
+        assert meta, "Pair does not exist"
+        token0, token1 = meta[0:2]
+        assert src == token0 or src == token1, "Path is not connected"
+        src = token1 if src == token0 else token0
+    return src
+
+def resolve_path(sell_token: str, buy_token: str, probe_amount: float, path: list, reverse: bool):
+    if path is not None:
+        assert len(path) > 0, "Path must not be empty"
+        assert path_destination(sell_token, path) == buy_token, "Path does not end in buy token"
+        return path
+
     token_a, token_b = (
         (buy_token, sell_token) if buy_token < sell_token else (sell_token, buy_token)
     )
-    
+
     pair_id = toks_to_pair[token_a, token_b]
-    assert pair_id is not None, "Pair does not exist"
-    
+    if pair_id is not None:
+        return [pair_id]
+
+    # No direct pair, let the router search for one. Buys only know the output
+    # amount, so the search runs from the bought token and the path is reversed.
     dex = importlib.import_module(DEX_CONTRACT)
-    dex_pairs = importlib.import_module(DEX_PAIRS)
-    reserve_a, reserve_b, not_used = dex_pairs.getReserves(pair_id)
+    if reverse:
+        found, amounts = dex.getBestRoute(probe_amount, buy_token, sell_token)
+        return found[::-1]
+
+    found, amounts = dex.getBestRoute(probe_amount, sell_token, buy_token)
+    return found
+
+def build_quote(sell_token: str, path: list, input_amount: float, minimum_output: float):
+    # Price impact is measured against the path's mid price, so it includes fees
+    dex = importlib.import_module(DEX_CONTRACT)
+    step = dex.getAmountsOutLadder([input_amount], sell_token, path)[0]
+    return {
+        "path": path,
+        "input_amount": input_amount,
+        "expected_output": step["amountOut"],
+        "minimum_output": minimum_output,
+        "price_impact": step["priceImpact"]
+    }
+
+def quote_buy(buy_token: str, sell_token: str, amount: float, slippage: float, path: list):
+    assert amount > 0, "Amount must be positive"
+    assert 0 <= slippage <= 100, "Slippage must be between 0 and 100%"
+    
+    path = resolve_path(sell_token, buy_token, amount, path, True)
     
-    if token_a == buy_token:
-        reserve_buy, reserve_sell = reserve_a, reserve_b
+    # getAmountsIn already includes each hop's own fee tier
+    dex = importlib.import_module(DEX_CONTRACT)
+    input_amount = dex.getAmountsIn(amount, sell_token, path)[0]
+    amount_in_max = input_amount * (1 + (slippage / 100))
+
+    # Without transfer fees on either end buy swaps for exactly amount, so the
+    # route's own input is what gets spent and slippage only caps it
+    if feeless_tokens[sell_token] and feeless_tokens[buy_token]:
+        quote = build_quote(sell_token, path, input_amount, amount)
+        quote["expected_output"] = amount
     else:
-        reserve_buy, reserve_sell = reserve_b, reserve_a
+        quote = build_quote(sell_token, path, amount_in_max, amount * (1 - slippage / 100))
+
+    quote["amount_in_max"] = amount_in_max
+    return quote
+
+def quote_sell(sell_token: str, buy_token: str, amount: float, slippage: float, path: list):
+    assert amount > 0, "Amount must be positive"
+    assert 0 <= slippage <= 100, "Slippage must be between 0 and 100%"
     
-    numerator = amount * reserve_sell
-    denominator = reserve_buy - amount
-    assert denominator > 0, "Cannot buy more than available in reserves"
+    path = resolve_path(sell_token, buy_token, amount, path, False)
     
-    input_amount = (numerator / denominator) * (1 + (slippage / 100))
-    input_amount = input_amount / 0.997  # 0.3% fee
-    input_amount = input_amount * 1.0001  # small buffer
+    quote = build_quote(sell_token, path, amount, 0)
+    quote["minimum_output"] = quote["expected_output"] * (1 - slippage / 100)
+    return quote
+
+@export
+def preview_buy(buy_token: str, sell_token: str, amount: float, slippage: float = 1, path: list = None):
+    return quote_buy(buy_token, sell_token, amount, slippage, path)
+
+@export
+def preview_sell(sell_token: str, buy_token: str, amount: float, slippage: float = 1, path: list = None):
+    return quote_sell(sell_token, buy_token, amount, slippage, path)
+
+@export
+def buy(
+    buy_token: str, 
+    sell_token: str, 
+    amount: float, 
+    slippage: float = 1, 
+    deadline_min: float = 1,
+    direct: bool = False,
+    path: list = None
+):
+    quote = quote_buy(buy_token, sell_token, amount, slippage, path)
+    amount_in_max = quote["amount_in_max"]
     
     sell_token_contract = importlib.import_module(sell_token)
     
     user_balance = sell_token_contract.balance_of(ctx.caller)
-    assert user_balance >= input_amount, (
-        f"Insufficient balance: have {user_balance}, need {input_amount}"
+    assert user_balance >= amount_in_max, (
+        f"Insufficient balance: have {user_balance}, need {amount_in_max}"
     )
 
-    sell_token_contract.transfer_from(
-        amount=input_amount, 
-        to=ctx.this, 
-        main_account=ctx.caller
-    )
+    dex = importlib.import_module(DEX_CONTRACT)
+    deadline = build_deadline(deadline_min)
+    payer = take_custody(sell_token, amount_in_max, direct)
+
+    # Same branch as quote_buy, the route delivers exactly amount and whatever
+    # of amount_in_max it did not spend goes back to the caller
+    if feeless_tokens[sell_token] and feeless_tokens[buy_token]:
+        spent = dex.swapTokensForExactTokens(
+            amountOut=amount,
+            amountInMax=amount_in_max,
+            path=quote["path"],
+            src=sell_token,
+            to=ctx.caller,
+            deadline=deadline,
+            payer=payer
+        )
+
+        if payer == ctx.this and amount_in_max > spent:
+            sell_token_contract.transfer(amount=amount_in_max - spent, to=ctx.caller)
 
-    sell_token_contract.approve(amount=input_amount, to=DEX_CONTRACT)
+        return spent, amount
 
-    output_amount = dex.swapExactTokenForTokenSupportingFeeOnTransferTokens(
-        amountIn=input_amount,
-        amountOutMin=amount * (1 - slippage / 100),
-        pair=pair_id,
+    output_amount = dex.swapExactTokensForTokensSupportingFeeOnTransferTokens(
+        amountIn=amount_in_max,
+        amountOutMin=quote["minimum_output"],
+        path=quote["path"],
         src=sell_token,
         to=ctx.caller,
-        deadline=build_deadline(deadline_min)
+        deadline=deadline,
+        payer=payer
     )
     
-    return input_amount, output_amount
+    return amount_in_max, output_amount
 
 @export
 def sell(
@@ -77,46 +174,21 @@ def sell(
     buy_token: str, 
     amount: float, 
     slippage: float = 1, 
-    deadline_min: float = 1
+    deadline_min: float = 1,
+    direct: bool = False,
+    path: list = None
 ):
-    assert amount > 0, "Amount must be positive"
-    assert 0 <= slippage <= 100, "Slippage must be between 0 and 100%"
-
-    token_a, token_b = (
-        (buy_token, sell_token) if buy_token < sell_token else (sell_token, buy_token)
-    )
-
-    pair_id = toks_to_pair[token_a, token_b]
-    assert pair_id is not None, "Pair does not exist"
+    quote = quote_sell(sell_token, buy_token, amount, slippage, path)
     
     dex = importlib.import_module(DEX_CONTRACT)
-    dex_pairs = importlib.import_module(DEX_PAIRS)
-    reserve_a, reserve_b, not_used = dex_pairs.getReserves(pair_id)
-    
-    if token_a == sell_token:
-        reserve_sell, reserve_buy = reserve_a, reserve_b
-    else:
-        reserve_sell, reserve_buy = reserve_b, reserve_a
-    
-    expected_output = dex.getAmountOut(amount, reserve_sell, reserve_buy)
-    
-    sell_token_contract = importlib.import_module(sell_token)
-    
-    sell_token_contract.transfer_from(
-        amount=amount, 
-        to=ctx.this, 
-        main_account=ctx.caller
-    )
-    
-    sell_token_contract.approve(amount=amount, to=DEX_CONTRACT)
-    
-    output_amount = dex.swapExactTokenForTokenSupportingFeeOnTransferTokens(
+    output_amount = dex.swapExactTokensForTokensSupportingFeeOnTransferTokens(
         amountIn=amount,
-        amountOutMin=expected_output * (1 - slippage / 100),
-        pair=pair_id,
+        amountOutMin=quote["minimum_output"],
+        path=quote["path"],
         src=sell_token,
         to=ctx.caller,
-        deadline=build_deadline(deadline_min)
+        deadline=build_deadline(deadline_min),
+        payer=take_custody(sell_token, amount, direct)
     )
     
     return amount, output_amount
@@ -0,0 +1,1089 @@
+import unittest
+import os
+import random
+import datetime
+from decimal import Decimal, localcontext
+
+from contracting.client import ContractingClient
+from contracting.stdlib.bridge.time import Datetime
+from contracting.stdlib.bridge.decimal import ContractingDecimal
+from nacl.signing import SigningKey
+
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+TOKEN_CODE = '''
+balances = Hash(default_value=0)
+
+@construct
+def seed():
+    balances[ctx.caller] = 1000000000
+
+@export
+def balance_of(address: str):
+    return balances[address]
+
+@export
+def transfer(amount: float, to: str):
+    assert amount > 0, 'Cannot send negative balances!'
+    assert balances[ctx.caller] >= amount, 'Not enough coins to send!'
+    balances[ctx.caller] -= amount
+    balances[to] += amount
+
+@export
+def approve(amount: float, to: str):
+    balances[ctx.caller, to] = amount
+
+@export
+def transfer_from(amount: float, to: str, main_account: str):
+    assert amount > 0, 'Cannot send negative balances!'
+    assert balances[main_account, ctx.caller] >= amount, 'Not enough coins approved!'
+    assert balances[main_account] >= amount, 'Not enough coins to send!'
+    balances[main_account, ctx.caller] -= amount
+    balances[main_account] -= amount
+    balances[to] += amount
+'''
+
+# Burns 1% of every transfer, so the receiver gets less than was sent
+TAXED_TOKEN_CODE = '''
+balances = Hash(default_value=0)
+
+@construct
+def seed():
+    balances[ctx.caller] = 1000000000
+
+@export
+def balance_of(address: str):
+    return balances[address]
+
+@export
+def transfer(amount: float, to: str):
+    assert amount > 0, 'Cannot send negative balances!'
+    assert balances[ctx.caller] >= amount, 'Not enough coins to send!'
+    balances[ctx.caller] -= amount
+    balances[to] += amount * 0.99
+
+@export
+def approve(amount: float, to: str):
+    balances[ctx.caller, to] = amount
+
+@export
+def transfer_from(amount: float, to: str, main_account: str):
+    assert amount > 0, 'Cannot send negative balances!'
+    assert balances[main_account, ctx.caller] >= amount, 'Not enough coins approved!'
+    assert balances[main_account] >= amount, 'Not enough coins to send!'
+    balances[main_account, ctx.caller] -= amount
+    balances[main_account] -= amount
+    balances[to] += amount * 0.99
+'''
+
+# Deposits and swaps in one transaction, so a rejected swap leaves no deposit behind
+TRADER_CODE = '''
+@export
+def trade(pair: int, token: str, amount_in: float, amount0_out: float, amount1_out: float):
+    importlib.import_module(token).approve(amount=amount_in, to='con_pairs')
+    pairs = importlib.import_module('con_pairs')
+    pairs.deposit(pair=pair, token=token, amount=amount_in)
+    pairs.swap(pair=pair, amount0Out=amount0_out, amount1Out=amount1_out, to=ctx.this)
+'''
+
+# Flash swap receiver, data picks what the callback does with the loan
+RECEIVER_CODE = '''
+target = Variable()
+
+@export
+def set_target(pair: int):
+    target.set(pair)
+
+@export
+def flashCallback(pair: int, amount0Out: float, amount1Out: float, data: str):
+    pairs = importlib.import_module('con_pairs')
+    if data == 'repay' or data == 'under':
+        repay = amount0Out * (1.004 if data == 'repay' else 1.001)
+        importlib.import_module('con_token_a').approve(amount=repay, to='con_pairs')
+        pairs.deposit(pair=pair, token='con_token_a', amount=repay)
+    elif data == 'swap':
+        pairs.swap(pair=pair, amount0Out=1, amount1Out=0, to=ctx.this)
+    elif data == 'credit':
+        pairs.credit(pair=pair, token='con_token_a', amount=1)
+    elif data == 'swapToPair':
+        pairs.swapToPair(pair=target.get(), amount0Out=1, amount1Out=0, to=pair)
+    elif data == 'flashSwap':
+        pairs.flashSwap(pair=pair, amount0Out=1, amount1Out=0, to=ctx.this, data='repay')
+'''
+
+
+class DexTestCase(unittest.TestCase):
+    """Deploys con_pairs and the router with a few plain tokens."""
+
+    tokens = ('con_token_a', 'con_token_b', 'con_token_c')
+
+    def setUp(self):
+        self.client = ContractingClient()
+        self.client.flush()
+
+        for name in self.tokens:
+            self.client.submit(TOKEN_CODE, name=name)
+
+        with open(os.path.join(HERE, 'con_pairs.py')) as f:
+            self.client.submit(f.read(), name='con_pairs')
+        with open(os.path.join(HERE, 'con_dex.py')) as f:
+            self.client.submit(f.read(), name='con_dex_v2')
+
+        self.pairs = self.client.get_contract('con_pairs')
+        self.dex = self.client.get_contract('con_dex_v2')
+        self.pairs.setRouter(router='con_dex_v2', enabled=True, signer='sys')
+
+        for name in self.tokens:
+            self.client.get_contract(name).approve(amount=10 ** 9, to='con_dex_v2', signer='sys')
+
+        self.test_time = Datetime(year=2026, month=1, day=1, hour=12, minute=0, second=0)
+        self.deadline = Datetime(year=2026, month=1, day=1, hour=13, minute=0, second=0)
+        self.environment = {"now": self.test_time, "chain_id": "test-chain"}
+
+    def tearDown(self):
+        self.client.flush()
+
+    def add_liquidity(self, token_a, token_b, amount_a, amount_b, signer='sys', fee=30, amp=0):
+        return self.dex.addLiquidity(
+            tokenA=token_a,
+            tokenB=token_b,
+            amountADesired=amount_a,
+            amountBDesired=amount_b,
+            amountAMin=0,
+            amountBMin=0,
+            to=signer,
+            deadline=self.deadline,
+            fee=fee,
+            amp=amp,
+            signer=signer,
+            environment=self.environment
+        )
+
+    def pair_for(self, token_a, token_b):
+        return self.pairs.pairFor(tokenA=token_a, tokenB=token_b, signer='sys')
+
+    def reserves(self, pair):
+        reserve0, reserve1, timestamp = self.pairs.getReserves(pair=pair, signer='sys')
+        return reserve0, reserve1
+
+
+class TestDeposits(DexTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.add_liquidity('con_token_a', 'con_token_b', 1000, 1000)
+        self.pair = self.pair_for('con_token_a', 'con_token_b')
+
+    def test_credit_from_unlisted_router_is_forbidden(self):
+        """Only routers whitelisted with setRouter may credit a pair"""
+        with self.assertRaises(AssertionError) as context:
+            self.pairs.credit(pair=self.pair, token='con_token_a', amount=100, signer='attacker')
+        self.assertIn('SNAKX: FORBIDDEN', str(context.exception))
+
+    def test_router_needs_set_router(self):
+        """A router that was never whitelisted cannot move tokens into pairs"""
+        self.pairs.setRouter(router='con_dex_v2', enabled=False, signer='sys')
+        with self.assertRaises(AssertionError) as context:
+            self.add_liquidity('con_token_a', 'con_token_b', 10, 10)
+        self.assertIn('SNAKX: FORBIDDEN', str(context.exception))
+
+    def test_taxed_token_credits_what_arrived(self):
+        """A fee-on-transfer token is credited only what reached con_pairs"""
+        self.client.submit(TAXED_TOKEN_CODE, name='con_taxed')
+        self.client.get_contract('con_taxed').approve(amount=10 ** 9, to='con_dex_v2', signer='sys')
+
+        self.add_liquidity('con_taxed', 'con_token_a', 1000, 1000)
+        pair = self.pair_for('con_taxed', 'con_token_a')
+
+        reserve_taxed, reserve_a = self.reserves(pair)
+        self.assertEqual(reserve_a, 1000)
+        self.assertEqual(reserve_taxed, 990)
+
+    def test_deposit_credits_the_pair(self):
+        """deposit pulls from the caller and credits the pair as surplus"""
+        token = self.client.get_contract('con_token_a')
+        token.approve(amount=50, to='con_pairs', signer='sys')
+        self.pairs.deposit(pair=self.pair, token='con_token_a', amount=50, signer='sys',
+                           environment=self.environment)
+
+        surplus0, surplus1 = self.pairs.getSurplus(pair=self.pair, signer='sys')
+        self.assertEqual(surplus0, 50)
+        self.assertEqual(surplus1, 0)
+
+    def test_deposit_wrong_token_reverts(self):
+        """deposit of a token that is not in the pair reverts, transfer included"""
+        token = self.client.get_contract('con_token_c')
+        token.approve(amount=50, to='con_pairs', signer='sys')
+        before = token.balance_of(address='sys')
+
+        with self.assertRaises(AssertionError) as context:
+            self.pairs.deposit(pair=self.pair, token='con_token_c', amount=50, signer='sys',
+                               environment=self.environment)
+        self.assertIn('SNAKX: WRONG_TOKEN', str(context.exception))
+        self.assertEqual(token.balance_of(address='sys'), before)
+
+    def test_swaps_on_unrelated_pairs_share_no_pair_state(self):
+        """Two swaps through pairs that only share the quote token write no
+        common con_pairs key, so a parallel executor can run them together"""
+        self.add_liquidity('con_token_a', 'con_token_c', 1000, 1000)
+        pair_b = self.pair
+        pair_c = self.pair_for('con_token_a', 'con_token_c')
+
+        writes = []
+        for pair, trader in ((pair_b, 'trader_1'), (pair_c, 'trader_2')):
+            token = self.client.get_contract('con_token_a')
+            token.transfer(amount=10, to=trader, signer='sys')
+            token.approve(amount=10, to='con_dex_v2', signer=trader)
+            output = self.dex.swapExactTokenForToken(
+                amountIn=10,
+                amountOutMin=0,
+                pair=pair,
+                src='con_token_a',
+                to=trader,
+                deadline=self.deadline,
+                signer=trader,
+                environment=self.environment,
+                return_full_output=True
+            )
+            self.assertEqual(output['status_code'], 0, output['result'])
+            writes.append(set(k for k in output['writes'] if k.startswith('con_pairs.')))
+
+        self.assertEqual(writes[0] & writes[1], set())
+
+
+class TestCreatePair(DexTestCase):
+
+    def create(self, fee=30, amp=0, signer='sys'):
+        return self.pairs.createPair(tokenA='con_token_a', tokenB='con_token_b', fee=fee, amp=amp,
+                                     signer=signer, environment=self.environment)
+
+    def test_anyone_creates_default_tier(self):
+        pair = self.create(signer='stranger')
+        self.assertEqual(self.pairs.pairs[pair, 'meta'][3:5], [30, 0])
+
+    def test_only_owner_picks_fee_tier(self):
+        with self.assertRaises(AssertionError) as context:
+            self.create(fee=100, signer='stranger')
+        self.assertIn('SNAKX: FORBIDDEN', str(context.exception))
+        self.assertIsNone(self.pair_for('con_token_a', 'con_token_b'))
+
+        pair = self.create(fee=100)
+        self.assertEqual(self.pairs.pairs[pair, 'meta'][3], 100)
+
+    def test_only_owner_creates_stable_pairs(self):
+        with self.assertRaises(AssertionError) as context:
+            self.create(amp=10000, signer='stranger')
+        self.assertIn('SNAKX: FORBIDDEN', str(context.exception))
+
+    def test_router_adds_only_to_the_expected_curve(self):
+        """Liquidity priced for one curve never lands in a pair with another"""
+        self.create(fee=5, amp=10000)
+
+        with self.assertRaises(AssertionError) as context:
+            self.add_liquidity('con_token_a', 'con_token_b', 10, 1000)
+        self.assertIn('SNAKX: CURVE_MISMATCH', str(context.exception))
+
+        self.add_liquidity('con_token_a', 'con_token_b', 1000, 1000, fee=5, amp=10000)
+
+    def test_router_creates_missing_pairs_on_the_default_curve_only(self):
+        with self.assertRaises(AssertionError) as context:
+            self.add_liquidity('con_token_a', 'con_token_b', 1000, 1000, fee=100)
+        self.assertIn('SNAKX: FORBIDDEN', str(context.exception))
+
+        self.add_liquidity('con_token_a', 'con_token_b', 1000, 1000)
+        pair = self.pair_for('con_token_a', 'con_token_b')
+        self.assertEqual(self.pairs.pairs[pair, 'meta'][3:5], [30, 0])
+
+
+class TestStableQuotes(DexTestCase):
+    """Router quotes for StableSwap pairs against the pair's own K check, which
+    compares two Newton solutions that each converge to 1e-24 relative"""
+
+    fee = 5
+    amp = 100
+    margin = ContractingDecimal('0.00000000000000000001')  # con_dex STABLE_MARGIN
+    samples = 50
+
+    def setUp(self):
+        super().setUp()
+        self.pair = self.pairs.createPair(tokenA='con_token_a', tokenB='con_token_b', fee=self.fee,
+                                          amp=self.amp, signer='sys', environment=self.environment)
+        self.add_liquidity('con_token_a', 'con_token_b', 100000, 100000, fee=self.fee, amp=self.amp)
+
+        self.client.submit(TRADER_CODE, name='con_trader')
+        self.trader = self.client.get_contract('con_trader')
+        for name in ('con_token_a', 'con_token_b'):
+            self.client.get_contract(name).transfer(amount=100000, to='con_trader', signer='sys')
+
+    def trade(self, zero_for_one, amount_in, amount_out):
+        return self.trader.trade(
+            pair=self.pair,
+            token='con_token_a' if zero_for_one else 'con_token_b',
+            amount_in=amount_in,
+            amount0_out=0 if zero_for_one else amount_out,
+            amount1_out=amount_out if zero_for_one else 0,
+            signer='sys',
+            environment=self.environment
+        )
+
+    def oriented_reserves(self, zero_for_one):
+        reserve0, reserve1 = self.reserves(self.pair)
+        return (reserve0, reserve1) if zero_for_one else (reserve1, reserve0)
+
+    def test_amount_out_quotes_pass_and_unpadded_quotes_fail(self):
+        rng = random.Random(7)
+        for i in range(self.samples):
+            zero_for_one = rng.random() < 0.5
+            reserve_in, reserve_out = self.oriented_reserves(zero_for_one)
+            amount_in = ContractingDecimal(str(round(float(reserve_in) * 10 ** rng.uniform(-6, -1), 8)))
+            amount_out = self.dex.getAmountOut(amountIn=amount_in, reserveIn=reserve_in,
+                                               reserveOut=reserve_out, fee=self.fee, amp=self.amp, signer='sys')
+
+            # The bare Newton answer, without the margin, lands outside the curve
+            with self.assertRaises(AssertionError) as context:
+                self.trade(zero_for_one, amount_in, amount_out + reserve_out * self.margin)
+            self.assertIn('SNAKX: K', str(context.exception))
+
+            self.trade(zero_for_one, amount_in, amount_out)
+
+    def test_amount_in_quotes_pass(self):
+        rng = random.Random(11)
+        for i in range(self.samples):
+            zero_for_one = rng.random() < 0.5
+            reserve_in, reserve_out = self.oriented_reserves(zero_for_one)
+            amount_out = ContractingDecimal(str(round(float(reserve_out) * 10 ** rng.uniform(-6, -1), 8)))
+            amount_in = self.dex.getAmountIn(amountOut=amount_out, reserveIn=reserve_in,
+                                             reserveOut=reserve_out, fee=self.fee, amp=self.amp, signer='sys')
+
+            self.trade(zero_for_one, amount_in, amount_out)
+
+
+class TestFlashSwap(DexTestCase):
+
+    receiver = 'con_flash_receiver'
+
+    def setUp(self):
+        super().setUp()
+        self.add_liquidity('con_token_a', 'con_token_b', 1000, 1000)
+        self.pair = self.pair_for('con_token_a', 'con_token_b')
+
+        self.client.submit(RECEIVER_CODE, name=self.receiver)
+        self.client.get_contract('con_token_a').transfer(amount=100, to=self.receiver, signer='sys')
+
+    def flash(self, data, amount=10):
+        return self.pairs.flashSwap(
+            pair=self.pair,
+            amount0Out=amount,
+            amount1Out=0,
+            to=self.receiver,
+            data=data,
+            signer='sys',
+            environment=self.environment
+        )
+
+    def assert_locked(self, data):
+        with self.assertRaises(AssertionError) as context:
+            self.flash(data)
+        self.assertIn('SNAKX: LOCKED', str(context.exception))
+        self.assertEqual(self.reserves(self.pair), (1000, 1000))
+
+    def test_repay_through_deposit(self):
+        """The loan plus fee comes back through deposit and the K check passes"""
+        self.flash('repay')
+
+        reserve0, reserve1 = self.reserves(self.pair)
+        self.assertEqual(reserve0, ContractingDecimal('1000.04'))
+        self.assertEqual(reserve1, 1000)
+        self.assertFalse(self.pairs.locks[self.pair])
+
+    def test_under_repay_fails_k(self):
+        """Repaying less than the fee requires is rejected and nothing moves"""
+        with self.assertRaises(AssertionError) as context:
+            self.flash('under')
+        self.assertIn('SNAKX: K', str(context.exception))
+        self.assertEqual(self.reserves(self.pair), (1000, 1000))
+        self.assertEqual(self.client.get_contract('con_token_a').balance_of(address=self.receiver), 100)
+
+    def test_callback_cannot_swap(self):
+        self.assert_locked('swap')
+
+    def test_callback_cannot_credit(self):
+        # Whitelisted so the lock, not the router check, is what stops it
+        self.pairs.setRouter(router=self.receiver, enabled=True, signer='sys')
+        self.assert_locked('credit')
+
+    def test_callback_cannot_swap_into_pair(self):
+        self.add_liquidity('con_token_a', 'con_token_c', 1000, 1000)
+        target = self.pair_for('con_token_a', 'con_token_c')
+        self.client.get_contract(self.receiver).set_target(pair=target, signer='sys')
+        self.assert_locked('swapToPair')
+
+    def test_callback_cannot_flash_again(self):
+        self.assert_locked('flashSwap')
+
+
+class TestLiquidityPermit(DexTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.add_liquidity('con_token_a', 'con_token_b', 1000, 1000)
+        self.pair = self.pair_for('con_token_a', 'con_token_b')
+
+        self.key = SigningKey.generate()
+        self.holder = self.key.verify_key.encode().hex()
+        self.pairs.liqTransfer(pair=self.pair, amount=10, to=self.holder, signer='sys')
+
+    def sign(self, amount, nonce=0, key=None):
+        # pair:account:spender:amount:nonce:deadline:contract:chain_id
+        message = '{}:{}:con_dex_v2:{}:{}:2026-01-01 13:00:00:con_pairs:test-chain'.format(
+            self.pair, self.holder, amount, nonce)
+        return (key or self.key).sign(message.encode()).signature.hex()
+
+    def remove(self, amount, signature, environment=None):
+        return self.dex.removeLiquidityWithPermit(
+            tokenA='con_token_a',
+            tokenB='con_token_b',
+            liquidity=amount,
+            amountAMin=0,
+            amountBMin=0,
+            to=self.holder,
+            deadline=self.deadline,
+            signature=signature,
+            signer=self.holder,
+            environment=environment or self.environment
+        )
+
+    def test_permit_removes_liquidity(self):
+        """Trailing zeros in the amount do not change the signed message"""
+        self.remove(ContractingDecimal('2.50'), self.sign('2.5'))
+
+        self.assertEqual(self.pairs.liqBalances[self.pair, self.holder], ContractingDecimal('7.5'))
+        self.assertEqual(self.pairs.liqNonces[self.holder], 1)
+        self.assertGreater(self.client.get_contract('con_token_a').balance_of(address=self.holder), 0)
+
+    def test_permit_cannot_be_replayed(self):
+        signature = self.sign(2)
+        self.remove(2, signature)
+
+        with self.assertRaises(AssertionError) as context:
+            self.remove(2, signature)
+        self.assertIn('SNAKX: INVALID_SIGNATURE', str(context.exception))
+        self.assertEqual(self.pairs.liqBalances[self.pair, self.holder], 8)
+
+    def test_front_run_permit_is_used(self):
+        """Someone submitting the signature first does not break the removal"""
+        signature = self.sign(2)
+        self.pairs.liqPermit(pair=self.pair, account=self.holder, spender='con_dex_v2', amount=2,
+                             deadline=self.deadline, signature=signature, signer='mallory',
+                             environment=self.environment)
+
+        self.remove(2, signature)
+        self.assertEqual(self.pairs.liqBalances[self.pair, self.holder], 8)
+        self.assertEqual(self.pairs.liqNonces[self.holder], 1)
+
+    def test_expired_permit_fails(self):
+        late = {"now": Datetime(year=2026, month=1, day=1, hour=14, minute=0, second=0), "chain_id": "test-chain"}
+        with self.assertRaises(AssertionError) as context:
+            self.remove(2, self.sign(2), environment=late)
+        self.assertIn('SNAKX: EXPIRED', str(context.exception))
+
+    def test_wrong_signer_fails(self):
+        with self.assertRaises(AssertionError) as context:
+            self.remove(2, self.sign(2, key=SigningKey.generate()))
+        self.assertIn('SNAKX: INVALID_SIGNATURE', str(context.exception))
+        self.assertEqual(self.pairs.liqBalances[self.pair, self.holder], 10)
+        self.assertEqual(self.pairs.liqNonces[self.holder], 0)
+
+
+class TestHelperPreview(DexTestCase):
+    """preview_buy and preview_sell quote the trade buy and sell then make"""
+
+    def setUp(self):
+        super().setUp()
+        with open(os.path.join(HERE, 'con_dex_helper.py')) as f:
+            self.client.submit(f.read(), name='con_dex_helper')
+        self.helper = self.client.get_contract('con_dex_helper')
+
+        self.client.submit(TAXED_TOKEN_CODE, name='con_taxed')
+        self.client.get_contract('con_taxed').approve(amount=10 ** 9, to='con_dex_v2', signer='sys')
+
+        for name in ('con_token_a', 'con_token_b'):
+            self.pairs.setFeeless(token=name, enabled=True, signer='sys')
+            self.client.get_contract(name).approve(amount=10 ** 9, to='con_dex_helper', signer='trader')
+
+        self.add_liquidity('con_token_a', 'con_token_b', 1000, 2000)
+        self.add_liquidity('con_taxed', 'con_token_a', 2000, 1000)
+        self.client.get_contract('con_token_a').transfer(amount=1000, to='trader', signer='sys')
+
+    def balance(self, token):
+        return self.client.get_contract(token).balance_of(address='trader')
+
+    def balance_of_helper(self, token):
+        return self.client.get_contract(token).balance_of(address='con_dex_helper')
+
+    def test_feeless_buy_matches_preview(self):
+        quote = self.helper.preview_buy(buy_token='con_token_b', sell_token='con_token_a', amount=10,
+                                        slippage=1, signer='trader', environment=self.environment)
+        self.assertEqual(quote['expected_output'], 10)
+        self.assertGreater(quote['amount_in_max'], quote['input_amount'])
+
+        sell_before, buy_before = self.balance('con_token_a'), self.balance('con_token_b')
+        spent, received = self.helper.buy(buy_token='con_token_b', sell_token='con_token_a', amount=10,
+                                          slippage=1, signer='trader', environment=self.environment)
+
+        self.assertEqual(spent, quote['input_amount'])
+        self.assertEqual(received, quote['expected_output'])
+        self.assertEqual(sell_before - self.balance('con_token_a'), quote['input_amount'])
+        self.assertEqual(self.balance('con_token_b') - buy_before, 10)
+        self.assertEqual(self.balance_of_helper('con_token_a'), 0)
+
+    def test_feeless_sell_matches_preview(self):
+        quote = self.helper.preview_sell(sell_token='con_token_a', buy_token='con_token_b', amount=10,
+                                         slippage=1, signer='trader', environment=self.environment)
+
+        buy_before = self.balance('con_token_b')
+        spent, received = self.helper.sell(sell_token='con_token_a', buy_token='con_token_b', amount=10,
+                                           slippage=1, signer='trader', environment=self.environment)
+
+        self.assertEqual(spent, quote['input_amount'])
+        self.assertEqual(received, quote['expected_output'])
+        self.assertEqual(self.balance('con_token_b') - buy_before, quote['expected_output'])
+
+    def test_unknown_pair_in_path_fails_cleanly(self):
+        with self.assertRaises(AssertionError) as context:
+            self.helper.preview_sell(sell_token='con_token_a', buy_token='con_token_b', amount=10,
+                                     path=[99], signer='trader', environment=self.environment)
+        self.assertIn('Pair does not exist', str(context.exception))
+
+    def test_taxed_buy_matches_preview(self):
+        """The taxed leg only lowers what arrives, never below the quoted minimum"""
+        quote = self.helper.preview_buy(buy_token='con_taxed', sell_token='con_token_a', amount=10,
+                                        slippage=1, signer='trader', environment=self.environment)
+        self.assertEqual(quote['input_amount'], quote['amount_in_max'])
+
+        sell_before, buy_before = self.balance('con_token_a'), self.balance('con_taxed')
+        spent, received = self.helper.buy(buy_token='con_taxed', sell_token='con_token_a', amount=10,
+                                          slippage=1, signer='trader', environment=self.environment)
+
+        self.assertEqual(spent, quote['input_amount'])
+        self.assertEqual(sell_before - self.balance('con_token_a'), quote['input_amount'])
+        self.assertEqual(self.balance('con_taxed') - buy_before, received)
+        self.assertEqual(received, quote['expected_output'] * ContractingDecimal('0.99'))
+        self.assertGreaterEqual(received, quote['minimum_output'])
+
+
+class TestProtocolFee(DexTestCase):
+    """The lazily accrued protocol fee, feeTo is the owner sys"""
+
+    def setUp(self):
+        super().setUp()
+        self.add_liquidity('con_token_a', 'con_token_b', 1000, 1000)
+        self.pair = self.pair_for('con_token_a', 'con_token_b')
+
+        for name in ('con_token_a', 'con_token_b'):
+            self.client.get_contract(name).transfer(amount=1000, to='lp', signer='sys')
+            self.client.get_contract(name).approve(amount=10 ** 9, to='con_dex_v2', signer='lp')
+
+    def trade(self, rounds=4, amount=100):
+        for i in range(rounds):
+            for src in ('con_token_a', 'con_token_b'):
+                self.dex.swapExactTokenForToken(amountIn=amount, amountOutMin=0, pair=self.pair, src=src,
+                                                to='sys', deadline=self.deadline, signer='sys',
+                                                environment=self.environment)
+
+    def root_k(self):
+        reserve0, reserve1 = self.reserves(self.pair)
+        return (Decimal(str(reserve0)) * Decimal(str(reserve1))).sqrt()
+
+    def supply(self):
+        return self.pairs.pairs[self.pair, 'totalSupply']
+
+    def fee_balance(self):
+        return self.pairs.liqBalances[self.pair, 'sys']
+
+    def assertNothingPending(self):
+        # kLast per share squared rounds down, which leaves dust of a few DECIMAL_UNIT
+        minted = self.pairs.claimFee(pair=self.pair, signer='sys', environment=self.environment)
+        self.assertLess(minted, ContractingDecimal('1e-24'))
+
+    def test_claim_fee_matches_eager_formula(self):
+        """What claimFee mints equals what a mint right after the swaps used to"""
+        with localcontext() as context:
+            context.prec = 60
+            root_k_last = self.root_k()
+            supply = Decimal(str(self.supply()))
+            self.trade()
+            root_k = self.root_k()
+            expected = supply * (root_k - root_k_last) / (root_k * 5 + root_k_last)
+
+            minted = self.pairs.claimFee(pair=self.pair, signer='sys', environment=self.environment)
+            self.assertGreater(minted, 0)
+            self.assertLess(abs(Decimal(str(minted)) - expected), Decimal('1e-24'))
+
+        self.assertNothingPending()
+
+    def test_fee_waits_below_threshold(self):
+        self.pairs.setFeeThreshold(threshold=1, signer='sys')
+        self.trade()
+        before = self.fee_balance()
+
+        self.add_liquidity('con_token_a', 'con_token_b', 100, 100, signer='lp')
+        self.assertEqual(self.fee_balance(), before)
+        self.assertGreater(self.pairs.claimFee(pair=self.pair, signer='sys', environment=self.environment), 0)
+
+    def test_threshold_realises_on_mint(self):
+        self.pairs.setFeeThreshold(threshold=ContractingDecimal('0.00001'), signer='sys')
+        self.trade()
+        before = self.fee_balance()
+
+        self.add_liquidity('con_token_a', 'con_token_b', 100, 100, signer='lp')
+        self.assertGreater(self.fee_balance(), before)
+        self.assertNothingPending()
+
+
+class TestOracle(DexTestCase):
+    """TWAPs against averages worked out by hand, the pair starts at price0 = 2
+    at 12:00, which is the start of an OBSERVATION_PERIOD"""
+
+    period = 600
+    slots = 144
+
+    def setUp(self):
+        super().setUp()
+        self.add_liquidity('con_token_a', 'con_token_b', 1000, 2000)
+        self.pair = self.pair_for('con_token_a', 'con_token_b')
+
+    def at(self, seconds):
+        moment = datetime.datetime(2026, 1, 1, 12) + datetime.timedelta(seconds=seconds)
+        return {"now": Datetime(year=moment.year, month=moment.month, day=moment.day, hour=moment.hour,
+                                minute=moment.minute, second=moment.second), "chain_id": "test-chain"}
+
+    def poke(self, seconds):
+        self.pairs.pokeOracle(pair=self.pair, signer='sys', environment=self.at(seconds))
+
+    def consult(self, seconds, window):
+        return self.pairs.consult(pair=self.pair, window=window, signer='sys', environment=self.at(seconds))
+
+    def assert_missing(self, seconds, window):
+        with self.assertRaises(AssertionError) as context:
+            self.consult(seconds, window)
+        self.assertIn('SNAKX: MISSING_OBSERVATION', str(context.exception))
+
+    def test_twap_over_a_price_change(self):
+        self.poke(600)
+        environment = self.at(900)
+        self.dex.swapExactTokenForToken(amountIn=100, amountOutMin=0, pair=self.pair, src='con_token_a',
+                                        to='sys', deadline=self.at(3600)['now'], signer='sys',
+                                        environment=environment)
+        reserve0, reserve1 = self.reserves(self.pair)
+        price0, price1 = reserve1 / reserve0, reserve0 / reserve1
+        self.poke(1200)
+
+        # 12:10 to 12:30: 300s at the opening price, then 900s at the new one
+        twap0, twap1 = self.consult(1800, 2 * self.period)
+        self.assertAlmostEqual(float(twap0), (2 * 300 + float(price0) * 900) / 1200, places=12)
+        self.assertAlmostEqual(float(twap1), (0.5 * 300 + float(price1) * 900) / 1200, places=12)
+
+        # 12:20 to 12:30 only saw the new price
+        twap0, twap1 = self.consult(1800, self.period)
+        self.assertAlmostEqual(float(twap0), float(price0), places=12)
+        self.assertAlmostEqual(float(twap1), float(price1), places=12)
+
+    def test_missing_observation(self):
+        # nothing updated the pair during 12:00 once it had a price
+        self.assert_missing(600, self.period)
+
+        # 12:20 was never poked
+        self.poke(600)
+        self.assert_missing(1800, self.period)
+
+    def test_window_bounds(self):
+        self.poke(600)
+        for window in (self.period - 1, (self.slots - 1) * self.period + 1):
+            with self.assertRaises(AssertionError) as context:
+                self.consult(1200, window)
+            self.assertIn('SNAKX: INVALID_WINDOW', str(context.exception))
+
+        self.assertEqual(self.consult(1200, self.period), (2, ContractingDecimal('0.5')))
+        self.assert_missing(1200, (self.slots - 1) * self.period)
+
+    def test_ring_buffer_wraps(self):
+        day = self.slots * self.period
+        self.poke(600)
+        self.poke(1200)
+        self.poke(600 + day)
+
+        # the 12:10 slot was overwritten a day later, 12:20 still holds yesterday's
+        twap0, twap1 = self.consult(1200 + day, self.period)
+        self.assertEqual((twap0, twap1), (2, ContractingDecimal('0.5')))
+        self.assert_missing(1800 + day, self.period)
+
+
+class TestZap(DexTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client.submit(TAXED_TOKEN_CODE, name='con_taxed')
+        self.client.get_contract('con_taxed').approve(amount=10 ** 9, to='con_dex_v2', signer='sys')
+
+        self.add_liquidity('con_token_a', 'con_token_b', 1000, 2000)
+        self.add_liquidity('con_taxed', 'con_token_a', 2000, 1000)
+        self.pair = self.pair_for('con_token_a', 'con_token_b')
+        self.taxed_pair = self.pair_for('con_taxed', 'con_token_a')
+
+    def balance(self, token, account):
+        return self.client.get_contract(token).balance_of(address=account)
+
+    def zap_in(self, pair, token, amount, min_liquidity=0, **kwargs):
+        return self.dex.zapIn(pair=pair, token=token, amount=amount, minLiquidity=min_liquidity, to='alice',
+                              deadline=self.deadline, signer='sys', environment=self.environment, **kwargs)
+
+    def zap_out(self, pair, liquidity, token, amount_out_min=0):
+        self.pairs.liqApprove(pair=pair, amount=liquidity, to='con_dex_v2', signer='alice')
+        return self.dex.zapOut(pair=pair, liquidity=liquidity, token=token, amountOutMin=amount_out_min,
+                               to='alice', deadline=self.deadline, signer='alice', environment=self.environment)
+
+    def oriented_reserve(self, pair, token):
+        reserve0, reserve1 = self.reserves(pair)
+        return reserve0 if token == self.pairs.pairs[pair, 'meta'][0] else reserve1
+
+    def assert_no_dust(self, *tokens):
+        for token in tokens:
+            self.assertEqual(self.balance(token, 'con_dex_v2'), 0)
+
+    def assert_zap_in(self, pair, token, other, amount, **kwargs):
+        """Nearly all of amount goes in, the other token's leftover reaches to"""
+        spent = self.balance(token, 'sys')
+        held = self.pairs.liqBalances[pair, 'alice']
+        kept = self.balance(token, 'alice')
+        leftover = self.balance(other, 'alice')
+        reserve = self.oriented_reserve(pair, other)
+        liquidity = self.zap_in(pair, token, amount, **kwargs)
+        spent -= self.balance(token, 'sys')
+
+        # the pair paid out swapOut of other and got amountOther back
+        self.assertEqual(self.balance(other, 'alice') - leftover, reserve - self.oriented_reserve(pair, other))
+
+        self.assertGreater(liquidity, 0)
+        self.assertEqual(self.pairs.liqBalances[pair, 'alice'] - held, liquidity)
+        self.assertLessEqual(spent, amount)
+        self.assertGreater(spent, amount * ContractingDecimal('0.999'))
+        self.assertEqual(self.balance(token, 'alice'), kept)
+        self.assert_no_dust(token, other)
+        return liquidity
+
+    def test_zap_in_splits_at_the_pool_ratio(self):
+        self.assert_zap_in(self.pair, 'con_token_a', 'con_token_b', 100)
+        self.assert_zap_in(self.pair, 'con_token_b', 'con_token_a', 100)
+
+    def test_zap_in_min_liquidity(self):
+        before = self.reserves(self.pair)
+        with self.assertRaises(AssertionError) as context:
+            self.zap_in(self.pair, 'con_token_a', 100, min_liquidity=1000)
+        self.assertIn('SNAKX: INSUFFICIENT_LIQUIDITY_MINTED', str(context.exception))
+        self.assertEqual(self.reserves(self.pair), before)
+
+    def test_zap_out_pays_one_token(self):
+        liquidity = self.zap_in(self.pair, 'con_token_a', 100)
+        leftover = self.balance('con_token_b', 'alice')
+
+        received = self.zap_out(self.pair, liquidity, 'con_token_a')
+        self.assertEqual(self.balance('con_token_a', 'alice'), received)
+        self.assertEqual(self.balance('con_token_b', 'alice'), leftover)
+        self.assertGreater(received, 99)
+        self.assert_no_dust('con_token_a', 'con_token_b')
+
+    def test_zap_out_min_amount(self):
+        liquidity = self.zap_in(self.pair, 'con_token_a', 100)
+        with self.assertRaises(AssertionError) as context:
+            self.zap_out(self.pair, liquidity, 'con_token_a', amount_out_min=100)
+        self.assertIn('SNAKX: INSUFFICIENT_OUTPUT_AMOUNT', str(context.exception))
+        self.assertEqual(self.pairs.liqBalances[self.pair, 'alice'], liquidity)
+
+    def test_taxed_tokens(self):
+        """What the taxed token loses on the way is never left in the router"""
+        self.client.get_contract('con_taxed').approve(amount=10 ** 9, to='con_dex_v2', signer='sys')
+        liquidity = self.zap_in(self.taxed_pair, 'con_token_a', 100)
+        self.assertGreater(liquidity, 0)
+        self.assert_no_dust('con_token_a', 'con_taxed')
+
+        liquidity += self.zap_in(self.taxed_pair, 'con_taxed', 100)
+        self.assert_no_dust('con_token_a', 'con_taxed')
+
+        received = self.zap_out(self.taxed_pair, liquidity, 'con_taxed')
+        self.assertEqual(self.balance('con_taxed', 'alice'), received)
+        self.assert_no_dust('con_token_a', 'con_taxed')
+
+    def test_stable_pair(self):
+        pair = self.pairs.createPair(tokenA='con_token_b', tokenB='con_token_c', fee=5, amp=100,
+                                     signer='sys', environment=self.environment)
+        self.add_liquidity('con_token_b', 'con_token_c', 10000, 10000, fee=5, amp=100)
+
+        with self.assertRaises(AssertionError) as context:
+            self.zap_in(pair, 'con_token_b', 100)
+        self.assertIn('SNAKX: CURVE_MISMATCH', str(context.exception))
+
+        liquidity = self.assert_zap_in(pair, 'con_token_b', 'con_token_c', 100, fee=5, amp=100)
+        received = self.zap_out(pair, liquidity, 'con_token_c')
+        self.assertGreater(received, 99)
+        self.assert_no_dust('con_token_b', 'con_token_c')
+
+
+class TestLiquidityMany(DexTestCase):
+    """Batched deposits and withdrawals keep every pair's recorded balances
+    equal to what con_pairs holds of each token"""
+
+    def setUp(self):
+        super().setUp()
+        self.client.submit(TAXED_TOKEN_CODE, name='con_taxed')
+        self.client.get_contract('con_taxed').approve(amount=10 ** 9, to='con_dex_v2', signer='sys')
+        for name in self.tokens:
+            self.pairs.setFeeless(token=name, enabled=True, signer='sys')
+
+        self.add_liquidity('con_token_a', 'con_token_b', 1000, 2000)
+        self.add_liquidity('con_token_a', 'con_token_c', 1000, 1000)
+        self.add_liquidity('con_taxed', 'con_token_a', 2000, 1000)
+        self.pair_ids = [self.pair_for('con_token_a', 'con_token_b'), self.pair_for('con_token_a', 'con_token_c'),
+                         self.pair_for('con_taxed', 'con_token_a')]
+
+    def balance(self, token, account):
+        return self.client.get_contract(token).balance_of(address=account)
+
+    def assert_reconciled(self):
+        held = {}
+        for pair in self.pair_ids:
+            token0, token1 = self.pairs.pairs[pair, 'meta'][0:2]
+            state = self.pairs.pairs[pair, 'state']
+            self.assertEqual(state[0:2], state[2:4])
+            held[token0] = held.get(token0, 0) + state[2]
+            held[token1] = held.get(token1, 0) + state[3]
+        for token, amount in held.items():
+            self.assertEqual(self.balance(token, 'con_pairs'), amount, token)
+
+    def add_many(self, to='alice'):
+        positions = [[pair, 100, 100, 0, 0, 30, 0] for pair in self.pair_ids]
+        return self.dex.addLiquidityMany(positions=positions, to=to, deadline=self.deadline, signer='sys',
+                                         environment=self.environment)
+
+    def remove_many(self, positions):
+        for pair, liquidity, amount0_min, amount1_min in positions:
+            self.pairs.liqApprove(pair=pair, amount=liquidity, to='con_dex_v2', signer='alice')
+        return self.dex.removeLiquidityMany(positions=positions, to='alice', deadline=self.deadline,
+                                            signer='alice', environment=self.environment)
+
+    def test_add_many(self):
+        spent = self.balance('con_token_a', 'sys')
+        results = self.add_many()
+        spent -= self.balance('con_token_a', 'sys')
+
+        # the single netted pull of con_token_a is exactly what the three pairs were credited
+        self.assertEqual(spent, sum(result[1] if i == 2 else result[0] for i, result in enumerate(results)))
+        for pair, result in zip(self.pair_ids, results):
+            self.assertEqual(self.pairs.liqBalances[pair, 'alice'], result[2])
+        self.assert_reconciled()
+
+    def test_add_many_checks_the_curve(self):
+        with self.assertRaises(AssertionError) as context:
+            self.dex.addLiquidityMany(positions=[[self.pair_ids[0], 100, 100, 0, 0, 5, 100]], to='alice',
+                                      deadline=self.deadline, signer='sys', environment=self.environment)
+        self.assertIn('SNAKX: CURVE_MISMATCH', str(context.exception))
+
+    def test_remove_many(self):
+        self.add_many()
+        positions = [[pair, self.pairs.liqBalances[pair, 'alice'], 0, 0] for pair in self.pair_ids]
+        amounts = self.remove_many(positions)
+
+        # feeless payouts arrive in full, the taxed one pair by pair less its tax
+        self.assertEqual(self.balance('con_token_a', 'alice'), amounts[0][0] + amounts[1][0] + amounts[2][1])
+        self.assertEqual(self.balance('con_token_b', 'alice'), amounts[0][1])
+        self.assertEqual(self.balance('con_token_c', 'alice'), amounts[1][1])
+        self.assertEqual(self.balance('con_taxed', 'alice'), amounts[2][0] * ContractingDecimal('0.99'))
+        for pair in self.pair_ids:
+            self.assertEqual(self.pairs.liqBalances[pair, 'alice'], 0)
+        self.assert_reconciled()
+
+    def test_remove_many_rejects_duplicate_pairs(self):
+        self.add_many()
+        pair = self.pair_ids[0]
+        half = self.pairs.liqBalances[pair, 'alice'] / 2
+        with self.assertRaises(AssertionError) as context:
+            self.remove_many([[pair, half, 0, 0], [pair, half, 0, 0]])
+        self.assertIn('SNAKX: DUPLICATE_PAIR', str(context.exception))
+        self.assert_reconciled()
+
+    def test_remove_many_minimums(self):
+        self.add_many()
+        positions = [[pair, self.pairs.liqBalances[pair, 'alice'], 0, 0] for pair in self.pair_ids]
+        positions[1][2] = 1000
+        with self.assertRaises(AssertionError) as context:
+            self.remove_many(positions)
+        self.assertIn('SNAKX: INSUFFICIENT_A_AMOUNT', str(context.exception))
+        self.assert_reconciled()
+
+
+class TestBestRoute(DexTestCase):
+    """con_token_a is a hub whose first pairs are filler, so anything paired
+    with it later sits past MAX_ROUTE_EDGES in its pair index"""
+
+    edges = 32  # con_dex MAX_ROUTE_EDGES
+    fillers = 40
+
+    def setUp(self):
+        super().setUp()
+        self.filler = []
+        for i in range(self.fillers):
+            name = 'con_hub_{:02d}'.format(i)
+            self.client.submit(TOKEN_CODE, name=name)
+            self.client.get_contract(name).approve(amount=10 ** 9, to='con_dex_v2', signer='sys')
+            self.add_liquidity('con_token_a', name, 1000, 1000)
+            self.filler.append(name)
+
+        for name in ('con_token_d', 'con_token_e'):
+            self.client.submit(TOKEN_CODE, name=name)
+            self.client.get_contract(name).approve(amount=10 ** 9, to='con_dex_v2', signer='sys')
+
+        self.add_liquidity('con_token_a', 'con_token_b', 1000, 1000)
+        self.add_liquidity('con_token_c', 'con_token_a', 1000, 1000)
+
+    def route(self, src, dst, max_hops):
+        path, amounts = self.dex.getBestRoute(amountIn=10, src=src, dst=dst, maxHops=max_hops, signer='sys')
+        return path
+
+    def assert_no_route(self, src, dst, max_hops):
+        with self.assertRaises(AssertionError) as context:
+            self.route(src, dst, max_hops)
+        self.assertIn('SNAKX: NO_ROUTE', str(context.exception))
+
+    def test_late_pair_of_hub_is_found(self):
+        self.assertGreater(self.pairs.tok_pairs_num['con_token_a'], self.edges)
+        pair_ab = self.pair_for('con_token_a', 'con_token_b')
+        pair_ca = self.pair_for('con_token_c', 'con_token_a')
+
+        self.assertEqual(self.route('con_token_a', 'con_token_b', 1), [pair_ab])
+        self.assertEqual(self.route('con_token_b', 'con_token_a', 2), [pair_ab])
+        self.assertEqual(self.route('con_token_c', 'con_token_b', 2), [pair_ca, pair_ab])
+
+    def test_intermediate_expansion_is_capped(self):
+        """Only the hub's first MAX_ROUTE_EDGES pairs are searched beyond"""
+        self.add_liquidity(self.filler[self.fillers - 1], 'con_token_d', 1000, 1000)
+        self.assert_no_route('con_token_a', 'con_token_d', 2)
+
+        self.add_liquidity(self.filler[5], 'con_token_d', 1000, 1000)
+        self.assertEqual(self.route('con_token_a', 'con_token_d', 2),
+                         [self.pair_for('con_token_a', self.filler[5]), self.pair_for(self.filler[5], 'con_token_d')])
+
+    def test_three_hops_at_most(self):
+        self.add_liquidity(self.filler[5], 'con_token_d', 1000, 1000)
+        self.add_liquidity('con_token_d', 'con_token_e', 1000, 1000)
+
+        self.assert_no_route('con_token_a', 'con_token_e', 2)
+        self.assertEqual(self.route('con_token_a', 'con_token_e', 3),
+                         [self.pair_for('con_token_a', self.filler[5]), self.pair_for(self.filler[5], 'con_token_d'),
+                          self.pair_for('con_token_d', 'con_token_e')])
+
+        with self.assertRaises(AssertionError) as context:
+            self.route('con_token_a', 'con_token_e', 4)
+        self.assertIn('SNAKX: INVALID_HOPS', str(context.exception))
+
+
+class TestExactOutput(DexTestCase):
+    """swapTokensForExactTokens pulls exactly getAmountsIn's first amount and
+    every hop of swapPath passes its K check with it"""
+
+    samples = 20
+
+    def setUp(self):
+        super().setUp()
+        self.client.submit(TOKEN_CODE, name='con_token_d')
+        self.client.get_contract('con_token_d').approve(amount=10 ** 9, to='con_dex_v2', signer='sys')
+
+        self.add_liquidity('con_token_a', 'con_token_b', 10000, 20000)
+        self.pairs.createPair(tokenA='con_token_b', tokenB='con_token_c', fee=100, signer='sys',
+                              environment=self.environment)
+        self.add_liquidity('con_token_b', 'con_token_c', 30000, 10000, fee=100)
+        self.pairs.createPair(tokenA='con_token_c', tokenB='con_token_d', fee=5, amp=100, signer='sys',
+                              environment=self.environment)
+        self.add_liquidity('con_token_c', 'con_token_d', 50000, 50000, fee=5, amp=100)
+        self.path = [self.pair_for('con_token_a', 'con_token_b'), self.pair_for('con_token_b', 'con_token_c'),
+                     self.pair_for('con_token_c', 'con_token_d')]
+
+    def balance(self, token, account):
+        return self.client.get_contract(token).balance_of(address=account)
+
+    def assert_exact(self, path, dst, amount_out):
+        amounts = self.dex.getAmountsIn(amountOut=amount_out, src='con_token_a', path=path, signer='sys')
+        before = self.balance('con_token_a', 'sys'), self.balance(dst, 'alice')
+
+        spent = self.dex.swapTokensForExactTokens(amountOut=amount_out, amountInMax=amounts[0], path=path,
+                                                  src='con_token_a', to='alice', deadline=self.deadline,
+                                                  signer='sys', environment=self.environment)
+
+        self.assertEqual(spent, amounts[0])
+        self.assertEqual(before[0] - self.balance('con_token_a', 'sys'), amounts[0])
+        self.assertEqual(self.balance(dst, 'alice') - before[1], amount_out)
+        for pair in path:
+            self.assertEqual(self.pairs.getSurplus(pair=pair, signer='sys'), (0, 0))
+
+    def test_two_hops(self):
+        rng = random.Random(3)
+        for i in range(self.samples):
+            amount_out = ContractingDecimal(str(round(rng.uniform(0.001, 100), rng.randint(0, 12))))
+            self.assert_exact(self.path[0:2], 'con_token_c', amount_out)
+
+    def test_three_hops_through_a_stable_pair(self):
+        rng = random.Random(5)
+        for i in range(self.samples):
+            amount_out = ContractingDecimal(str(round(rng.uniform(0.001, 100), rng.randint(0, 12))))
+            self.assert_exact(self.path, 'con_token_d', amount_out)
+
+    def test_input_cap(self):
+        amounts = self.dex.getAmountsIn(amountOut=10, src='con_token_a', path=self.path, signer='sys')
+        with self.assertRaises(AssertionError) as context:
+            self.dex.swapTokensForExactTokens(amountOut=10, amountInMax=amounts[0] - ContractingDecimal('1e-30'),
+                                              path=self.path, src='con_token_a', to='alice',
+                                              deadline=self.deadline, signer='sys', environment=self.environment)
+        self.assertIn('SNAKX: EXCESSIVE_INPUT_AMOUNT', str(context.exception))
+
+
+class TestCompactEvents(DexTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.add_liquidity('con_token_a', 'con_token_b', 1000, 1000)
+        self.add_liquidity('con_token_b', 'con_token_c', 1000, 1000)
+        self.path = [self.pair_for('con_token_a', 'con_token_b'), self.pair_for('con_token_b', 'con_token_c')]
+
+    def events(self, path):
+        output = self.dex.swapExactTokensForTokens(amountIn=10, amountOutMin=0, path=path, src='con_token_a',
+                                                   to='alice', deadline=self.deadline, signer='sys',
+                                                   environment=self.environment, return_full_output=True)
+        self.assertEqual(output['status_code'], 0)
+        return [(event['contract'], event['event']) for event in output['events']]
+
+    def test_default_events_per_hop(self):
+        self.assertEqual(self.events(self.path), [('con_pairs', 'Sync'), ('con_pairs', 'Swap')] * 2)
+        self.assertEqual(self.events(self.path[0:1]), [('con_pairs', 'Sync'), ('con_pairs', 'Swap')])
+
+    def test_compact_events(self):
+        self.pairs.setCompactEvents(enabled=True, signer='sys')
+
+        self.assertEqual(self.events(self.path),
+                         [('con_pairs', 'SwapSync')] * 2 + [('con_dex_v2', 'RouteSwap')])
+        self.assertEqual(self.events(self.path[0:1]), [('con_pairs', 'SwapSync')])
+
+    def test_route_swap_describes_the_route(self):
+        self.pairs.setCompactEvents(enabled=True, signer='sys')
+        amounts = self.dex.getAmountsOut(amountIn=10, src='con_token_a', path=self.path, signer='sys')
+
+        output = self.dex.swapExactTokensForTokens(amountIn=10, amountOutMin=0, path=self.path, src='con_token_a',
+                                                   to='alice', deadline=self.deadline, signer='sys',
+                                                   environment=self.environment, return_full_output=True)
+        event = output['events'][-1]
+        self.assertEqual(event['data_indexed'], {'src': 'con_token_a', 'to': 'alice'})
+        self.assertEqual(event['data']['path'], ','.join(str(pair) for pair in self.path))
+        self.assertEqual(event['data']['amounts'], ','.join(str(amount) for amount in amounts))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,11 +1,23 @@
 MINIMUM_LIQUIDITY = 0.00000001
 MAXIMUM_BALANCE = 1e14
+FEE_BPS = 30 #default swap fee tier, 0.3%
+FEE_DENOMINATOR = 10000
+DECIMAL_UNIT = 0.000000000000000000000000000001 #smallest decimal step
+MAX_AMP = 10000 #StableSwap amplification limit
+STABLE_ITERATIONS = 64 #Newton steps before giving up on convergence
+STABLE_PRECISION = 0.000000000000000000000001 #relative change that counts as converged
+FLASH_LOCK = "flash" #lock value while a flash swap callback runs, only deposit is open
+OBSERVATION_PERIOD = 600 #seconds covered by one oracle slot
+OBSERVATION_SLOTS = 144 #ring buffer length, a day of history
+OBSERVATION_EPOCH = datetime.datetime(2024, 1, 1)
 
 PairCreated = LogEvent(event="PairCreated",
 	params={
 	"token0": {'type':str, 'idx':True},
 	"token1": {'type':str, 'idx':True},
-	"pair":   {'type':int}
+	"pair":   {'type':int},
+	"fee":    {'type':int},
+	"amp":    {'type':int}
 	}
 )
 	
@@ -38,6 +50,20 @@ Swap = LogEvent(event="Swap",
 	}
 )
 
+#Swap and Sync of one swap in a single event, emitted instead of both in compact mode
+SwapSync = LogEvent(event="SwapSync",
+	params={
+	"pair":       {'type':int, 'idx':True},
+	"amount0In":  {'type':(int,float,decimal)},
+	"amount1In":  {'type':(int,float,decimal)},
+	"amount0Out": {'type':(int,float,decimal)},
+	"amount1Out": {'type':(int,float,decimal)},
+	"to":         {'type':(str,int), 'idx':True},
+	"reserve0":   {'type':(int,float,decimal)},
+	"reserve1":   {'type':(int,float,decimal)}
+	}
+)
+
 Sync = LogEvent(event="Sync",
 	params={
 	"pair":      {'type':int, 'idx':True},
@@ -65,13 +91,30 @@ ApproveLiq = LogEvent(event="ApproveLiq",
 )
     
 toks_to_pair = Hash(default_value=None)
+tok_pairs = Hash(default_value=None)
+tok_pairs_num = Hash(default_value=0)
 pairs = Hash(default_value=0)
 pairs_num = Variable()
 feeTo = Variable()
+feeThreshold = Variable()
+compactEvents = Variable()
 owner = Variable()
-balances = Hash(default_value=0.0)
+routers = Hash(default_value=False)
+validTokens = Hash(default_value=False)
+feelessTokens = Hash(default_value=False)
+feeTiers = Hash(default_value=False)
+liqNonces = Hash(default_value=0)
 
-LOCK = Variable()
+#LP positions live apart from pair config so pair snapshots stay small,
+#holders are numbered per pair from 0 the first time they receive liquidity
+liqBalances = Hash(default_value=0)
+liqAllowances = Hash(default_value=0)
+liqHolders = Hash(default_value=None)
+liqHolders_num = Hash(default_value=0)
+liqHolderIds = Hash(default_value=0)
+
+locks = Hash(default_value=False)
+observations = Hash(default_value=None)
 
 
 token_interface = [
@@ -81,13 +124,29 @@ token_interface = [
     #importlib.Var('balances', Hash),
 ]
 
+flash_interface = [
+    importlib.Func('flashCallback', args=('pair', 'amount0Out', 'amount1Out', 'data')),
+]
+
 @construct
 def constructor():
 	pairs_num.set(0)
 	owner.set(ctx.signer)
 	feeTo.set(ctx.signer)
-	LOCK.set(False)
-	
+	feeThreshold.set(0.001)
+	compactEvents.set(False)
+	feeTiers[5] = True
+	feeTiers[30] = True
+	feeTiers[100] = True
+	
+#reentrancy guard, keyed per pair so unrelated pairs never share lock state
+def lock(pair: int):
+	assert not locks[pair], "SNAKX: LOCKED"
+	locks[pair] = True
+
+def unlock(pair: int):
+	locks[pair] = False
+
 @export
 def enableFee(en: bool):
 	assert ctx.caller == owner.get(), "SNAKX: FORBIDDEN"
@@ -95,43 +154,68 @@ def enableFee(en: bool):
 		feeTo.set(owner.get())
 	else:
 		feeTo.set(False)
+
+#growth of sqrt(k) per LP share, e.g. 0.001 for 0.1%, past which mint and burn
+#realise the pending protocol fee instead of leaving it for claimFee
+@export
+def setFeeThreshold(threshold: float):
+	assert ctx.caller == owner.get(), "SNAKX: FORBIDDEN"
+	assert threshold >= 0, "SNAKX: INVALID_THRESHOLD"
+	feeThreshold.set(threshold)
 	
-#factory
+#swap fees in bps of FEE_DENOMINATOR a pair can be created with
+@export
+def setFeeTier(fee: int, enabled: bool):
+	assert ctx.caller == owner.get(), "SNAKX: FORBIDDEN"
+	assert fee >= 0 and fee < FEE_DENOMINATOR, "SNAKX: INVALID_FEE"
+	feeTiers[fee] = enabled
+
+#compact mode coalesces Sync into SwapSync and has the router add one RouteSwap per route
 @export
-def createPair(tokenA: str, tokenB: str):
+def setCompactEvents(enabled: bool):
+	assert ctx.caller == owner.get(), "SNAKX: FORBIDDEN"
+	compactEvents.set(enabled)
+
+#factory, fee and curve are fixed for the pair's lifetime. amp 0 is the constant
+#product curve, a positive amp makes a StableSwap pair for correlated tokens.
+#There is one pair per token pair, so only the owner may pick a tier other than
+#FEE_BPS or a StableSwap curve, anyone else would lock the pair into it before
+#it is listed
+@export
+def createPair(tokenA: str, tokenB: str, fee: int = FEE_BPS, amp: int = 0):
 	assert tokenA != tokenB, 'SNAKX: IDENTICAL_ADDRESSES'
 	assert tokenA < tokenB, 'SNAKX: BAD_ORDER'
 	assert toks_to_pair[tokenA,tokenB] == None, 'SNAKX: PAIR_EXISTS'
+	assert feeTiers[fee], 'SNAKX: INVALID_FEE'
+	assert (fee == FEE_BPS and amp == 0) or ctx.caller == owner.get(), 'SNAKX: FORBIDDEN'
+	assert amp >= 0 and amp <= MAX_AMP, 'SNAKX: INVALID_AMP'
 	
 	
 	
-	tA = importlib.import_module(tokenA)
-	assert importlib.enforce_interface(tA, token_interface), 'SNAKX: NO_TOKA'
+	if not validTokens[tokenA]:
+		tA = importlib.import_module(tokenA)
+		assert importlib.enforce_interface(tA, token_interface), 'SNAKX: NO_TOKA'
+		validTokens[tokenA] = True
 	
-	tB = importlib.import_module(tokenB)
-	assert importlib.enforce_interface(tB, token_interface), 'SNAKX: NO_TOKB'
+	if not validTokens[tokenB]:
+		tB = importlib.import_module(tokenB)
+		assert importlib.enforce_interface(tB, token_interface), 'SNAKX: NO_TOKB'
+		validTokens[tokenB] = True
 	
 	
 	p_num = pairs_num.get() + 1
 	pairs_num.set(p_num)
-	pairs[p_num, "token0"] = tokenA
-	pairs[p_num, "token1"] = tokenB
-	
-	pairs[p_num, "reserve0"] = 0.0
-	pairs[p_num, "reserve1"] = 0.0
-	
-	pairs[p_num, "balance0"] = 0.0
-	pairs[p_num, "balance1"] = 0.0
-	
-	pairs[p_num, "blockTimestampLast"] = now
+	pairs[p_num, "meta"] = [tokenA, tokenB, now, fee, amp]
+	pairs[p_num, "state"] = [0.0, 0.0, 0.0, 0.0, now, 0.0, 0.0]
 	
 	pairs[p_num, "totalSupply"] = 0.0
 	pairs[p_num, "kLast"] = 0.0
-	pairs[p_num, "creationTime"] = now
 	
 	toks_to_pair[tokenA,tokenB] = p_num
+	addTokenPair(tokenA, p_num, tokenB, fee, amp)
+	addTokenPair(tokenB, p_num, tokenA, fee, amp)
 	
-	PairCreated({"token0": tokenA, "token1": tokenB, "pair": p_num})
+	PairCreated({"token0": tokenA, "token1": tokenB, "pair": p_num, "fee": fee, "amp": amp})
 	return p_num
 	
 @export
@@ -140,383 +224,712 @@ def pairFor(tokenA: str, tokenB: str):
 		tokenA, tokenB = tokenB, tokenA
 	return toks_to_pair[tokenA, tokenB]
 
+#adjacency list per token, entries are [pair, other token, fee, amp] at offsets 0..n-1
+def addTokenPair(token: str, pair: int, other: str, fee: int, amp: int):
+	n = tok_pairs_num[token]
+	tok_pairs[token, n] = [pair, other, fee, amp]
+	tok_pairs_num[token] = n + 1
+
+@export
+def pairsForToken(token: str, start: int, count: int):
+	assert start >= 0 and count >= 0, 'SNAKX: INVALID_RANGE'
+	last = min(start + count, tok_pairs_num[token])
+	edges = []
+	for i in range(start, last):
+		pair, other, fee, amp = tok_pairs[token, i]
+		edges.append({"pair": pair, "token": other, "fee": fee, "amp": amp})
+	return edges
+
+#liqHolderIds keeps a holder's position plus one, 0 means not listed yet
+def addLiq(pair: int, account: str, value: float):
+	if not liqHolderIds[pair, account]:
+		n = liqHolders_num[pair]
+		liqHolders[pair, n] = account
+		liqHolders_num[pair] = n + 1
+		liqHolderIds[pair, account] = n + 1
+	liqBalances[pair, account] += value
+
+#everyone who ever held liquidity of a pair with their current balance,
+#accounts that exited stay listed with balance 0
+@export
+def liqHoldersOf(pair: int, start: int, count: int):
+	assert start >= 0 and count >= 0, 'SNAKX: INVALID_RANGE'
+	last = min(start + count, liqHolders_num[pair])
+	holders = []
+	for i in range(start, last):
+		account = liqHolders[pair, i]
+		holders.append({"account": account, "balance": liqBalances[pair, account]})
+	return holders
+
 @export
 def liqTransfer(pair: int, amount: float, to: str):
 	assert amount > 0, 'Cannot send negative balances!'
-	assert pairs[pair, "balances", ctx.caller] >= amount, 'Not enough coins to send!'
+	assert liqBalances[pair, ctx.caller] >= amount, 'Not enough coins to send!'
 	
-	pairs[pair, "balances", ctx.caller] -= amount
-	pairs[pair, "balances", to] += amount
+	liqBalances[pair, ctx.caller] -= amount
+	addLiq(pair, to, amount)
 	
 	TransferLiq({"pair": pair, "from": ctx.caller, "to": to, "amount": amount})
     
 @export
 def liqApprove(pair: int, amount: float, to: str):
 	assert amount > 0, 'Cannot send negative balances!'
-	pairs[pair, "balances", ctx.caller, to] = amount
+	liqAllowances[pair, ctx.caller, to] = amount
 	
 	ApproveLiq({"pair": pair, "from": ctx.caller, "to": to, "amount": amount})
+
+#amount as plain decimal digits, no exponent and no trailing zeros: 5, 0.25, 1000.5.
+#Built digit by digit so it never depends on how the runtime prints decimals
+def permitAmount(amount: float):
+	whole = int(amount)
+	fraction = amount - whole
+	digits = ""
+	for i in range(30):
+		if fraction <= 0:
+			break
+		fraction = fraction * 10
+		digit = int(fraction)
+		digits += str(digit)
+		fraction -= digit
+	if digits == "":
+		return str(whole)
+	return "{}.{}".format(whole, digits)
+
+#what an LP holder signs to approve without sending liqApprove themselves:
+#"{pair}:{account}:{spender}:{amount}:{nonce}:{deadline}:{contract}:{chain_id}"
+#with amount from permitAmount, deadline as "YYYY-MM-DD HH:MM:SS" and nonce the
+#account's current liqNonces. Contract and chain stop cross-deployment replays,
+#the nonce makes every permit single use and lets the holder void an unused one
+#by using another
+def liqPermitMessage(pair: int, account: str, spender: str, amount: float, nonce: int, deadline: datetime.datetime):
+	return "{}:{}:{}:{}:{}:{}:{}:{}".format(
+		pair, account, spender, permitAmount(amount), nonce, deadline, ctx.this, chain_id)
+
+@export
+def liqPermit(pair: int, account: str, spender: str, amount: float, deadline: datetime.datetime, signature: str):
+	assert now < deadline, 'SNAKX: EXPIRED'
+	assert amount > 0, 'Cannot send negative balances!'
+	nonce = liqNonces[account]
+	message = liqPermitMessage(pair, account, spender, amount, nonce, deadline)
+	assert crypto.verify(account, message, signature), 'SNAKX: INVALID_SIGNATURE'
+	liqNonces[account] = nonce + 1
+	liqAllowances[pair, account, spender] = amount
+	
+	ApproveLiq({"pair": pair, "from": account, "to": spender, "amount": amount})
 	
 @export
 def liqTransfer_from(pair: int, amount: float, to: str, main_account: str):
 	assert amount > 0, 'Cannot send negative balances!'
-	assert pairs[pair, "balances", main_account, ctx.caller] >= amount, \
-		'Not enough coins approved to send! You have {} and are trying to spend {}'.format(pairs[pair, "balances", main_account, ctx.caller], amount)
-	assert pairs[pair, "balances", main_account] >= amount, 'Not enough coins to send!'
+	assert liqAllowances[pair, main_account, ctx.caller] >= amount, \
+		'Not enough coins approved to send! You have {} and are trying to spend {}'.format(liqAllowances[pair, main_account, ctx.caller], amount)
+	assert liqBalances[pair, main_account] >= amount, 'Not enough coins to send!'
 	
-	pairs[pair, "balances", main_account, ctx.caller] -= amount
-	pairs[pair, "balances", main_account] -= amount
-	pairs[pair, "balances", to] += amount
+	liqAllowances[pair, main_account, ctx.caller] -= amount
+	liqBalances[pair, main_account] -= amount
+	addLiq(pair, to, amount)
 	
 	TransferLiq({"pair": pair, "from": main_account, "to": to, "amount": amount})
 
 
-def safeTransferFromPair(pair: int, token: str, to: str, value: float):
-	assert value >= 0 and value <= MAXIMUM_BALANCE, 'p2a Invalid value!'
+#packed pair layout, "meta" never changes after createPair and "state" holds
+#everything a swap touches so it costs one read and one write per pair
+#meta  = [token0, token1, creationTime, fee, amp]
+#state = [reserve0, reserve1, balance0, balance1, blockTimestampLast,
+#         price0CumulativeLast, price1CumulativeLast]
+def pairMeta(pair: int):
+	meta = pairs[pair, "meta"]
+	assert meta, 'SNAKX: NO_PAIR'
+	return meta
+
+def pairState(pair: int):
+	state = pairs[pair, "state"]
+	assert state, 'SNAKX: NO_PAIR'
+	return state
+
+#tokens are checked against token_interface once, when first seen in createPair
+def tokenContract(token: str):
 	t = importlib.import_module(token)
-	assert importlib.enforce_interface(t, token_interface)
-	#tok_balances = ForeignHash(foreign_contract=token, foreign_name='balances')
-	prev_balance = t.balance_of(ctx.this)
-	
-	if(prev_balance == None):
-		prev_balance = 0
-		
+	if not validTokens[token]:
+		assert importlib.enforce_interface(t, token_interface), 'SNAKX: NO_TOKEN'
+		validTokens[token] = True
+	return t
+
+def transferOut(token: str, to: str, value: float):
+	assert value >= 0 and value <= MAXIMUM_BALANCE, 'p2a Invalid value!'
+	t = tokenContract(token)
 	
-	if(token == pairs[pair, "token0"]):
-		assert pairs[pair, "balance0"] >= value, 'p2a Not enough coins to send!' 
+	if feelessTokens[token]:
 		t.transfer(value, to)
-		#new_balance = tok_balances[ctx.this]
-		new_balance = t.balance_of(ctx.this)
-		assert new_balance >= 0, "p2a Negative balance!"
-		pairs[pair, "balance0"] += new_balance - prev_balance
-		assert pairs[pair, "balance0"] >= 0, "p2a Negative pair balance0!"
-		return True
-		
+		return value
 	
-	elif(token == pairs[pair, "token1"]):
-		assert pairs[pair, "balance1"] >= value, 'p2a Not enough coins to send!' 
-		t.transfer(value, to)
-		#new_balance = tok_balances[ctx.this]
-		new_balance = t.balance_of(ctx.this)
-		assert new_balance >= 0, "p2a Negative balance!"
-		pairs[pair, "balance1"] += new_balance - prev_balance
-		assert pairs[pair, "balance1"] >= 0, "p2a Negative pair balance1!"
-		return True
-		
+	prev_balance = t.balance_of(ctx.this)
 	
-	assert False, "p2a Wrong token!"
+	if(prev_balance == None):
+		prev_balance = 0
 	
-	return False
+	t.transfer(value, to)
+	new_balance = t.balance_of(ctx.this)
+	assert new_balance >= 0, "p2a Negative balance!"
+	return prev_balance - new_balance
 
 
-def safeTransferFromPairToPair(pair: int, token: str, to: int, value: float):
-	assert value >= 0 and value <= MAXIMUM_BALANCE, 'p2p Invalid value!'
-	
-	if(token == pairs[pair, "token0"]):
-		assert pairs[pair, "balance0"] >= value, 'p2p Not enough coins to send!'
-		
-		#prev_balance = pairs[pair, "balance0"]
-		
-		pairs[pair, "balance0"] -= value
-		
-		if(pairs[to, "token0"] == token):
-			pairs[to, "balance0"] += value
-		elif(pairs[to, "token1"] == token):
-			pairs[to, "balance1"] += value
-		else:
-			assert False, "p2p No token in TO"
-		
-		new_balance = pairs[pair, "balance0"]
-		
-		assert new_balance >= 0, "p2p Negative balance!"
-		
-		return True
-	elif(token == pairs[pair, "token1"]):
-		assert pairs[pair, "balance1"] >= value, 'p2p Not enough coins to send!' 
-		
-		#prev_balance = pairs[pair, "balance1"]
-		
-		pairs[pair, "balance1"] -= value
-		
-		if(pairs[to, "token0"] == token):
-			pairs[to, "balance0"] += value
-		elif(pairs[to, "token1"] == token):
-			pairs[to, "balance1"] += value
-		else:
-			assert False, "p2p No token in TO"
-		
-		new_balance = pairs[pair, "balance1"]
-		
-		assert new_balance >= 0, "p2p Negative balance!"
-		
-		return True
-	
-	assert False, "p2p Wrong token!"
+def internal_credit(pair: int, token: str, value: float):
+	assert value >= 0, "SNAKX: NEGATIVE_DEPOSIT"
+	token0, token1 = pairMeta(pair)[0:2]
+	state = pairState(pair)
+	
+	if(token == token0):
+		state[2] += value
+		assert state[2] <= MAXIMUM_BALANCE, "SNAKX: TokenA OVERFLOW"
+	elif(token == token1):
+		state[3] += value
+		assert state[3] <= MAXIMUM_BALANCE, "SNAKX: TokenB OVERFLOW"
+	else:
+		assert False, "SNAKX: WRONG_TOKEN"
 	
-	return False
+	pairs[pair, "state"] = state
 
+@export
+def setRouter(router: str, enabled: bool):
+	assert ctx.caller == owner.get(), "SNAKX: FORBIDDEN"
+	routers[router] = enabled
 
-def sync(pair: int):
-	tokenA = pairs[pair, "token0"]
-	tokenB = pairs[pair, "token1"]
-	
-	tA = importlib.import_module(tokenA)
-	assert importlib.enforce_interface(tA, token_interface)
-	#hashA = ForeignHash(foreign_contract=tokenA, foreign_name='balances')
-	#balA = hashA[ctx.this]
-	
-	balA = tA.balance_of(ctx.this)
-	if balA == None:
-		balA = 0.0
-	
-	tB = importlib.import_module(tokenB)
-	assert importlib.enforce_interface(tB, token_interface)
-	#hashB = ForeignHash(foreign_contract=tokenB, foreign_name='balances')
-	#balB = hashB[ctx.this]
-	
-	balB = tB.balance_of(ctx.this)
-	if balB == None:
-		balB = 0.0
-	
-	balances[tokenA] = balA
-	balances[tokenB] = balB
+#tokens that always move exactly the amount sent, e.g. currency, skip the
+#balance_of measurements around transfers here and in the router
+@export
+def setFeeless(token: str, enabled: bool):
+	assert ctx.caller == owner.get(), "SNAKX: FORBIDDEN"
+	feelessTokens[token] = enabled
 
+#receipt for tokens a trusted router has already moved into this contract,
+#the router measures what actually arrived so fee-on-transfer tokens are safe
+@export
+def credit(pair: int, token: str, amount: float):
+	assert routers[ctx.caller], "SNAKX: FORBIDDEN"
+	assert not locks[pair], "SNAKX: LOCKED"
+	internal_credit(pair, token, amount)
+
+#permissionless deposit, pulls from the caller (who must approve con_pairs),
+#also how a flash swap callback repays the pair it is borrowing from
 #noreentry
 @export
-def sync2(pair: int):
-	assert not LOCK.get(), "SNAKX: LOCKED"
-	LOCK.set(True)
-	tokenA = pairs[pair, "token0"]
-	tokenB = pairs[pair, "token1"]
-	
-	tA = importlib.import_module(tokenA)
-	assert importlib.enforce_interface(tA, token_interface)
-	#hashA = ForeignHash(foreign_contract=tokenA, foreign_name='balances')
-	#balA = hashA[ctx.this]
-	
-	balA = tA.balance_of(ctx.this)
-	if balA == None:
-		balA = 0.0
-	
-	tB = importlib.import_module(tokenB)
-	assert importlib.enforce_interface(tB, token_interface)
-	#hashB = ForeignHash(foreign_contract=tokenB, foreign_name='balances')
-	#balB = hashB[ctx.this]
-	
-	balB = tB.balance_of(ctx.this)
-	if balB == None:
-		balB = 0.0
+def deposit(pair: int, token: str, amount: float):
+	flash = locks[pair] == FLASH_LOCK
+	if not flash:
+		lock(pair)
+	assert amount > 0, "SNAKX: INSUFFICIENT_AMOUNT"
+	t = tokenContract(token)
+	
+	if feelessTokens[token]:
+		t.transfer_from(amount, ctx.this, ctx.caller)
+		received = amount
+	else:
+		prev_balance = t.balance_of(ctx.this)
+		if(prev_balance == None):
+			prev_balance = 0
 		
-	incA = balA - balances[tokenA]
-	assert incA >= 0, "SNAKX: token0_neg"
-	incB = balB - balances[tokenB]
-	assert incB >= 0, "SNAKX: token1_neg"
+		t.transfer_from(amount, ctx.this, ctx.caller)
+		received = t.balance_of(ctx.this) - prev_balance
 	
-	pairs[pair, "balance0"] += incA
-	pairs[pair, "balance1"] += incB
+	internal_credit(pair, token, received)
 	
-	assert pairs[pair, "balance0"] <= MAXIMUM_BALANCE, "SNAKX: TokenA OVERFLOW"
-	assert pairs[pair, "balance1"] <= MAXIMUM_BALANCE, "SNAKX: TokenB OVERFLOW"
-	
-	balances[tokenA] = balA
-	balances[tokenB] = balB
-	
-	LOCK.set(False)
+	if not flash:
+		unlock(pair)
+	return received
 
 
 @export
 def getReserves(pair: int):
-	return pairs[pair, "reserve0"], pairs[pair, "reserve1"], pairs[pair, "blockTimestampLast"]
+	state = pairState(pair)
+	return state[0], state[1], state[4]
 	
 @export
 def getSurplus(pair: int):
-	return pairs[pair, "balance0"] - pairs[pair, "reserve0"], pairs[pair, "balance1"] - pairs[pair, "reserve1"]
-	
-#def internal_update(pair: int, balance0: float, balance1: float, UNS_reserve0: float, UNS_reserve1: float):
-def internal_update(pair: int, balance0: float, balance1: float):
+	state = pairState(pair)
+	return state[2] - state[0], state[3] - state[1]
+	
+def pairInfo(pair: int):
+	token0, token1, creationTime, fee, amp = pairMeta(pair)
+	state = pairState(pair)
+	return {
+		"pair": pair,
+		"token0": token0,
+		"token1": token1,
+		"fee": fee,
+		"amp": amp,
+		"reserve0": state[0],
+		"reserve1": state[1],
+		"blockTimestampLast": state[4],
+		"totalSupply": pairs[pair, "totalSupply"]
+	}
+
+#market state for many pairs in one call
+@export
+def getReservesMany(pairIds: list):
+	infos = []
+	for pair in pairIds:
+		infos.append(pairInfo(pair))
+	return infos
+
+#pair ids run from 1 to pairs_num
+@export
+def listPairs(start: int, count: int):
+	assert start >= 1 and count >= 0, 'SNAKX: INVALID_RANGE'
+	last = min(start + count, pairs_num.get() + 1)
+	infos = []
+	for pair in range(start, last):
+		infos.append(pairInfo(pair))
+	return infos
+	
+#settles balances into reserves, the whole hot state is rewritten in one go
+def internal_update(pair: int, state: list, balance0: float, balance1: float, sync: bool = True):
 	assert balance0 <= MAXIMUM_BALANCE and balance1 <= MAXIMUM_BALANCE, "SNAKX: BALANCE OVERFLOW"
-	pairs[pair, "reserve0"] = balance0
-	pairs[pair, "reserve1"] = balance1
-	pairs[pair, "blockTimestampLast"] = now
-	Sync({"pair":pair,"reserve0":balance0,"reserve1":balance1});
-#emit
+	state = accumulate(pair, state)
+	pairs[pair, "state"] = [balance0, balance1, balance0, balance1, now, state[5], state[6]]
+	if sync:
+		Sync({"pair":pair,"reserve0":balance0,"reserve1":balance1});
+
+#internal_update for swaps, Sync then Swap or a single SwapSync in compact mode
+def internal_swapUpdate(pair: int, state: list, balance0: float, balance1: float,
+	amount0In: float, amount1In: float, amount0Out: float, amount1Out: float, to: str):
+	compact = compactEvents.get()
+	internal_update(pair, state, balance0, balance1, not compact)
+	if compact:
+		SwapSync({"pair": pair,
+			"amount0In": amount0In, "amount1In": amount1In,
+			"amount0Out": amount0Out, "amount1Out": amount1Out,
+			"to": to, "reserve0": balance0, "reserve1": balance1})
+	else:
+		Swap({"pair": pair,
+			"amount0In": amount0In, "amount1In": amount1In,
+			"amount0Out": amount0Out, "amount1Out": amount1Out,
+			"to": to})
+
+def observationSlot(timestamp: datetime.datetime):
+	return int((timestamp - OBSERVATION_EPOCH).seconds) // OBSERVATION_PERIOD
+
+#brings the price accumulators up to now using the reserves that held since the
+#last update, the first update in each OBSERVATION_PERIOD also records an
+#observation in the ring buffer that consult reads
+def accumulate(pair: int, state: list):
+	elapsed = (now - state[4]).seconds
+	if elapsed > 0 and state[0] > 0 and state[1] > 0:
+		state[5] += (state[1] / state[0]) * elapsed
+		state[6] += (state[0] / state[1]) * elapsed
+	
+	slot = observationSlot(now)
+	if slot != observationSlot(state[4]):
+		observations[pair, slot % OBSERVATION_SLOTS] = [slot, now, state[5], state[6]]
+	
+	state[4] = now
+	return state
+
+#keeps the oracle observed for pairs that trade less than once per period
+#noreentry
+@export
+def pokeOracle(pair: int):
+	lock(pair)
+	pairs[pair, "state"] = accumulate(pair, pairState(pair))
+	unlock(pair)
+
+#time weighted average prices over roughly the last window seconds, price0 is
+#token0 priced in token1, costs two state reads whatever the window
+@export
+def consult(pair: int, window: int):
+	assert window >= OBSERVATION_PERIOD and window <= (OBSERVATION_SLOTS - 1) * OBSERVATION_PERIOD, 'SNAKX: INVALID_WINDOW'
+	state = pairState(pair)
+	
+	price0Cumulative = state[5]
+	price1Cumulative = state[6]
+	elapsed = (now - state[4]).seconds
+	if elapsed > 0 and state[0] > 0 and state[1] > 0:
+		price0Cumulative += (state[1] / state[0]) * elapsed
+		price1Cumulative += (state[0] / state[1]) * elapsed
+	
+	slot = observationSlot(now) - window // OBSERVATION_PERIOD
+	observation = observations[pair, slot % OBSERVATION_SLOTS]
+	assert observation and observation[0] == slot, 'SNAKX: MISSING_OBSERVATION'
+	
+	timeElapsed = (now - observation[1]).seconds
+	assert timeElapsed > 0, 'SNAKX: MISSING_OBSERVATION'
+	return (price0Cumulative - observation[2]) / timeElapsed, (price1Cumulative - observation[3]) / timeElapsed
+
+#square root rounded down to a whole DECIMAL_UNIT, the decimal power is
+#correctly rounded so one step back is all it can be off by
+def sqrtFloor(x: float):
+	y = x ** 0.5
+	if (y * y > x):
+		y -= DECIMAL_UNIT
+	return y
+
+#StableSwap invariant D for two coins, A*4*(x0+x1) + D = A*4*D + D^3/(4*x0*x1),
+#solved by Newton's method with divisions ordered to stay in decimal range
+def stableD(x0: float, x1: float, amp: int):
+	S = x0 + x1
+	if (S == 0):
+		return 0
+	D = S
+	Ann = amp * 4
+	for i in range(STABLE_ITERATIONS):
+		D_P = D * D / (x0 * 2) * D / (x1 * 2)
+		DPrev = D
+		D = (Ann * S + D_P * 2) / ((Ann - 1) * D + D_P * 3) * D
+		if (abs(D - DPrev) <= D * STABLE_PRECISION):
+			return D
+	assert False, 'SNAKX: NO_CONVERGENCE'
+
+#fee taken as amount * bps / denominator, the products stay unscaled so they fit
+#the decimal range for balances up to MAXIMUM_BALANCE. StableSwap pairs check
+#that the fee-adjusted balances did not lower D instead of x*y
+def checkK(reserve0: float, reserve1: float, balance0: float, balance1: float, amount0In: float, amount1In: float, fee: int, amp: int):
+	balance0Adjusted = (balance0) - (amount0In * fee / FEE_DENOMINATOR)
+	balance1Adjusted = (balance1) - (amount1In * fee / FEE_DENOMINATOR)
+	if (amp > 0):
+		assert stableD(balance0Adjusted, balance1Adjusted, amp) >= stableD(reserve0, reserve1, amp), 'SNAKX: K'
+	else:
+		assert (balance0Adjusted * balance1Adjusted) >= (reserve0 * reserve1), 'SNAKX: K'
 
+#the invariant the protocol fee is measured on, D squared for StableSwap pairs
+#so that its square root grows with fees like sqrt(x*y) does
+def pairK(pair: int, reserve0: float, reserve1: float):
+	amp = pairMeta(pair)[4]
+	if (amp > 0):
+		D = stableD(reserve0, reserve1, amp)
+		return D * D
+	return reserve0 * reserve1
+
+#the protocol fee accrues lazily, "kLast" holds k per supply squared at the last
+#realisation which proportional mints and burns leave unchanged, so they only
+#compare k against it and skip the square roots. Pending fee is minted to feeTo
+#by claimFee or once sqrt(k) per share grew past feeThreshold. Until then the
+#pending fee is shared by whoever holds liquidity: LPs that burn take their
+#pro-rata part of it with the reserves, and LPs that mint pay for a pro-rata
+#part of a fee earned before they joined. feeThreshold bounds both, the pending
+#fee stays under a sixth of feeThreshold times the pair's liquidity
 def internal_mintFee(pair: int, reserve0: float, reserve1: float):
 	feeOn = feeTo.get() != False
 	kLast = pairs[pair, "kLast"]
 	if (feeOn):
 		if (kLast != 0):
-			rootK = (reserve0 * reserve1) ** 0.5;
-			rootKLast = kLast ** 0.5;
-			if (rootK > rootKLast):
-				numerator = pairs[pair, "totalSupply"] * (rootK - rootKLast);
-				denominator = rootK * 5 + rootKLast;
-				liquidity = numerator / denominator;
-				if (liquidity > 0):
-					internal_mint(pair, feeTo.get(), liquidity);
+			totalSupply = pairs[pair, "totalSupply"]
+			growth = 1 + feeThreshold.get()
+			k = pairK(pair, reserve0, reserve1)
+			if (k > kLast * totalSupply * totalSupply * growth * growth):
+				internal_realiseFee(pair, k, kLast, totalSupply)
 	elif(kLast != 0): 
 		pairs[pair, "kLast"] = 0.0
-	return feeOn
+	return feeOn and kLast == 0
+
+#mints feeTo 1/6th of the sqrt(k) growth since kLast and restarts the accrual
+def internal_realiseFee(pair: int, k: float, kLast: float, totalSupply: float):
+	rootK = sqrtFloor(k);
+	rootKLast = sqrtFloor(kLast) * totalSupply;
+	liquidity = 0
+	if (rootK > rootKLast):
+		numerator = totalSupply * (rootK - rootKLast);
+		denominator = rootK * 5 + rootKLast;
+		liquidity = numerator / denominator;
+		if (liquidity > 0):
+			internal_mint(pair, feeTo.get(), liquidity);
+			totalSupply += liquidity
+	pairs[pair, "kLast"] = k / (totalSupply * totalSupply)
+	return liquidity
+
+#starts the accrual once fees are on and the pair has liquidity
+def internal_snapshotK(pair: int, balance0: float, balance1: float):
+	totalSupply = pairs[pair, "totalSupply"]
+	pairs[pair, "kLast"] = pairK(pair, balance0, balance1) / (totalSupply * totalSupply)
+
+#mints the pending protocol fee of a pair to feeTo
+#noreentry
+@export
+def claimFee(pair: int):
+	lock(pair)
+	
+	assert feeTo.get() != False, "SNAKX: FEE_OFF"
+	state = pairState(pair)
+	reserve0, reserve1 = state[0:2]
+	
+	kLast = pairs[pair, "kLast"]
+	totalSupply = pairs[pair, "totalSupply"]
+	assert totalSupply > 0, "SNAKX: NO_LIQUIDITY"
+	
+	liquidity = 0
+	if (kLast == 0):
+		internal_snapshotK(pair, reserve0, reserve1)
+	else:
+		liquidity = internal_realiseFee(pair, pairK(pair, reserve0, reserve1), kLast, totalSupply)
+	
+	unlock(pair)
+	return liquidity
 
 def internal_burn(pair: int, src: str, value: float):
 	pairs[pair, "totalSupply"] -= value
 	assert pairs[pair, "totalSupply"] >= 0, "Negative supply!"
-	pairs[pair, "balances", src] -= value
-	assert pairs[pair, "balances", src] >= 0, "Negative balance!"
+	liqBalances[pair, src] -= value
+	assert liqBalances[pair, src] >= 0, "Negative balance!"
+
+#sends a burn payout, or books feeless tokens in owed so burnMany sends them once per token
+def payOut(token: str, to: str, value: float, owed: dict):
+	if owed != None and feelessTokens[token]:
+		owed[token] = owed.get(token, 0) + value
+		return value
+	return transferOut(token, to, value)
 
 #noreentry
 @export
 def burn(pair: int, to: str):
-	assert not LOCK.get(), "SNAKX: LOCKED"
-	LOCK.set(True)
-	
-	reserve0, reserve1, ignore = getReserves(pair)
-	
-	token0 = pairs[pair, "token0"]
-	token1 = pairs[pair, "token1"]
-	balance0 = pairs[pair, "balance0"]
-	balance1 = pairs[pair, "balance1"]
+	lock(pair)
+	amount0, amount1 = internal_burnPair(pair, to, None)
+	unlock(pair)
+	return amount0, amount1
+
+#burn for several pairs at once, each burns the liquidity it holds of itself.
+#Feeless payouts are summed per token and sent in one transfer, taxed tokens
+#still leave pair by pair so every balance follows what actually left
+#noreentry
+@export
+def burnMany(pairIds: list, to: str):
+	assert len(pairIds) >= 1, 'SNAKX: INVALID_LENGTHS'
+	for pair in pairIds:
+		lock(pair)
+	
+	owed = {}
+	amounts = []
+	for pair in pairIds:
+		amount0, amount1 = internal_burnPair(pair, to, owed)
+		amounts.append([amount0, amount1])
+	for token in owed:
+		transferOut(token, to, owed[token])
+	
+	for pair in pairIds:
+		unlock(pair)
+	return amounts
+
+def internal_burnPair(pair: int, to: str, owed: dict):
+	token0, token1 = pairMeta(pair)[0:2]
+	state = pairState(pair)
+	reserve0, reserve1, balance0, balance1 = state[0:4]
 
-	liquidity = pairs[pair, "balances", ctx.this]
+	liquidity = liqBalances[pair, ctx.this]
 	
-	feeOn = internal_mintFee(pair, reserve0, reserve1);
+	snapshot = internal_mintFee(pair, reserve0, reserve1);
 	totalSupply = pairs[pair, "totalSupply"]
 	amount0 = (liquidity * balance0) / totalSupply
 	amount1 = (liquidity * balance1) / totalSupply
 	assert amount0 > 0 and amount1 > 0, 'SNAKX: INSUFFICIENT_LIQUIDITY_BURNED'
 	internal_burn(pair, ctx.this, liquidity)
-	safeTransferFromPair(pair, token0, to, amount0);
-	safeTransferFromPair(pair, token1, to, amount1);
-	
-	balance0 = pairs[pair, "balance0"]
-	balance1 = pairs[pair, "balance1"]
-	
+	balance0 -= payOut(token0, to, amount0, owed)
+	balance1 -= payOut(token1, to, amount1, owed)
+	assert balance0 >= 0 and balance1 >= 0, "SNAKX: NEGATIVE_BALANCE"
 
-	#internal_update(pair, balance0, balance1, UNS_reserve0, UNS_reserve1);
-	internal_update(pair, balance0, balance1);
-	sync(pair)
-	if (feeOn):
-		pairs[pair, "kLast"] = balance0 * balance1
+	internal_update(pair, state, balance0, balance1);
+	if (snapshot):
+		internal_snapshotK(pair, balance0, balance1)
 		
 	Burn({"pair": pair, "amount0": amount0, "amount1": amount1, "to": to})
 	
-	LOCK.set(False)
 	return amount0, amount1
 
 
 def internal_mint(pair: int, to: str, value: float):
 	pairs[pair, "totalSupply"] += value
-	pairs[pair, "balances", to] += value
+	addLiq(pair, to, value)
 
 #noreentry
 @export
 def mint(pair: int, to: str):
-	assert not LOCK.get(), "SNAKX: LOCKED"
-	LOCK.set(True)
+	lock(pair)
 	
-	reserve0, reserve1, ignore = getReserves(pair)
-	balance0 = pairs[pair, "balance0"]
-	balance1 = pairs[pair, "balance1"]
+	state = pairState(pair)
+	reserve0, reserve1, balance0, balance1 = state[0:4]
 	
 	amount0 = balance0 - reserve0
 	amount1 = balance1 - reserve1
 	
-	feeOn = internal_mintFee(pair, reserve0, reserve1)
+	snapshot = internal_mintFee(pair, reserve0, reserve1)
 	totalSupply = pairs[pair, "totalSupply"]
 	
 	liquidity = 0
 	if (totalSupply == 0):
-		liquidity = ((amount0 * amount1) ** 0.5) - MINIMUM_LIQUIDITY;
+		liquidity = sqrtFloor(amount0 * amount1) - MINIMUM_LIQUIDITY;
 		internal_mint(pair, "DEAD", MINIMUM_LIQUIDITY) # permanently lock the first MINIMUM_LIQUIDITY tokens
 	else:
 		liquidity = min((amount0 * totalSupply) / reserve0, (amount1 * totalSupply) / reserve1)
 	assert liquidity > 0, 'SNAKX: INSUFFICIENT_LIQUIDITY_MINTED'
 	internal_mint(pair, to, liquidity)
 	
-	#internal_update(pair, balance0, balance1, UNS_reserve0, UNS_reserve1);
-	internal_update(pair, balance0, balance1)
-	sync(pair)
-	if (feeOn):
-		pairs[pair, "kLast"] = balance0 * balance1
+	internal_update(pair, state, balance0, balance1)
+	if (snapshot):
+		internal_snapshotK(pair, balance0, balance1)
 	
 	Mint({"pair": pair, "amount0": amount0, "amount1": amount1, "to": to})
 	
-	LOCK.set(False)
+	unlock(pair)
 	return liquidity
 	
 			
 #noreentry
 @export
 def swap(pair: int, amount0Out: float, amount1Out: float, to: str):
-	assert not LOCK.get(), "SNAKX: LOCKED"
-	LOCK.set(True)
+	lock(pair)
 	
 	assert amount0Out > 0 or amount1Out > 0, 'SNAKX: INSUFFICIENT_OUTPUT_AMOUNT'
-	reserve0, reserve1, ignore = getReserves(pair)
+	token0, token1, ignore, fee, amp = pairMeta(pair)
+	state = pairState(pair)
+	reserve0, reserve1, balance0, balance1 = state[0:4]
 	assert amount0Out < reserve0 and amount1Out < reserve1, 'SNAKX: INSUFFICIENT_LIQUIDITY'
-	token0 = pairs[pair, "token0"]
-	token1 = pairs[pair, "token1"]
 	assert to != token0 and to != token1, 'SNAKX: INVALID_TO'
 	
 	if (amount0Out > 0):
-		safeTransferFromPair(pair, token0, to, amount0Out)
+		assert balance0 >= amount0Out, 'p2a Not enough coins to send!'
+		balance0 -= transferOut(token0, to, amount0Out)
 	if (amount1Out > 0):
-		safeTransferFromPair(pair, token1, to, amount1Out)
-	balance0 = pairs[pair, "balance0"]
-	balance1 = pairs[pair, "balance1"]
+		assert balance1 >= amount1Out, 'p2a Not enough coins to send!'
+		balance1 -= transferOut(token1, to, amount1Out)
+	assert balance0 >= 0 and balance1 >= 0, "SNAKX: NEGATIVE_BALANCE"
 	amount0In = balance0 - (reserve0 - amount0Out) if balance0 > reserve0 - amount0Out else 0
 	amount1In = balance1 - (reserve1 - amount1Out) if balance1 > reserve1 - amount1Out else 0
 	assert amount0In > 0 or amount1In > 0, 'SNAKX: INSUFFICIENT_INPUT_AMOUNT'
-	balance0Adjusted = (balance0) - (amount0In * 0.003)
-	balance1Adjusted = (balance1) - (amount1In * 0.003)
-	assert (balance0Adjusted * balance1Adjusted) >= (reserve0 * reserve1), 'SNAKX: K'
-#		or abs((balance0Adjusted * balance1Adjusted) - (reserve0 * reserve1)) < MINIMUM_LIQUIDITY, 'SNAKX: K'
-
-	#internal_update(pair, balance0, balance1, reserve0, reserve1);
-	internal_update(pair, balance0, balance1)
-	sync(pair)
-	
-	Swap({"pair": pair,
-		"amount0In": amount0In, "amount1In": amount1In,
-		"amount0Out": amount0Out, "amount1Out": amount1Out,
-		"to": to})
+	checkK(reserve0, reserve1, balance0, balance1, amount0In, amount1In, fee, amp)
+
+	internal_swapUpdate(pair, state, balance0, balance1,
+		amount0In, amount1In, amount0Out, amount1Out, to)
 		
-	LOCK.set(False)
+	unlock(pair)
 	#emit Swap(msg.sender, amount0In, amount1In, amount0Out, amount1Out, to);
 	
 #noreentry
 @export
 def swapToPair(pair: int, amount0Out: float, amount1Out: float, to: int):
-	assert not LOCK.get(), "SNAKX: LOCKED"
-	LOCK.set(True)
+	lock(pair)
+	assert not locks[to], "SNAKX: LOCKED"
 	
 	assert amount0Out > 0 or amount1Out > 0, 'SNAKX: INSUFFICIENT_OUTPUT_AMOUNT'
-	reserve0, reserve1, ignore = getReserves(pair)
+	token0, token1, ignore, fee, amp = pairMeta(pair)
+	state = pairState(pair)
+	reserve0, reserve1, balance0, balance1 = state[0:4]
 	assert amount0Out < reserve0 and amount1Out < reserve1, 'SNAKX: INSUFFICIENT_LIQUIDITY'
-	token0 = pairs[pair, "token0"]
-	token1 = pairs[pair, "token1"]
 
 	if (amount0Out > 0):
-		safeTransferFromPairToPair(pair, token0, to, amount0Out)
+		assert balance0 >= amount0Out, 'p2p Not enough coins to send!'
+		balance0 -= amount0Out
+		internal_credit(to, token0, amount0Out)
 	if (amount1Out > 0):
-		safeTransferFromPairToPair(pair, token1, to, amount1Out)
-	balance0 = pairs[pair, "balance0"]
-	balance1 = pairs[pair, "balance1"]
+		assert balance1 >= amount1Out, 'p2p Not enough coins to send!'
+		balance1 -= amount1Out
+		internal_credit(to, token1, amount1Out)
 	amount0In = balance0 - (reserve0 - amount0Out) if balance0 > reserve0 - amount0Out else 0
 	amount1In = balance1 - (reserve1 - amount1Out) if balance1 > reserve1 - amount1Out else 0
 	assert amount0In > 0 or amount1In > 0, 'SNAKX: INSUFFICIENT_INPUT_AMOUNT'
-	balance0Adjusted = (balance0) - (amount0In * 0.003)
-	balance1Adjusted = (balance1) - (amount1In * 0.003)
-	assert (balance0Adjusted * balance1Adjusted) >= (reserve0 * reserve1), 'SNAKX: K'
-#		or abs((balance0Adjusted * balance1Adjusted) - (reserve0 * reserve1)) < MINIMUM_LIQUIDITY, 'SNAKX: K'
-
-	#internal_update(pair, balance0, balance1, reserve0, reserve1);
-	internal_update(pair, balance0, balance1);
-	
-	Swap({"pair": pair,
-		"amount0In": amount0In, "amount1In": amount1In,
-		"amount0Out": amount0Out, "amount1Out": amount1Out,
-		"to": to})
+	checkK(reserve0, reserve1, balance0, balance1, amount0In, amount1In, fee, amp)
+
+	internal_swapUpdate(pair, state, balance0, balance1,
+		amount0In, amount1In, amount0Out, amount1Out, to)
 		
-	LOCK.set(False)
+	unlock(pair)
 	#emit Swap(msg.sender, amount0In, amount1In, amount0Out, amount1Out, to);
+	
+#optimistic swap: the outputs are sent to the `to` contract first, then its
+#flashCallback(pair, amount0Out, amount1Out, data) runs and must pay the pair
+#back through deposit, the K check (fee included) happens after it returns
+#noreentry
+@export
+def flashSwap(pair: int, amount0Out: float, amount1Out: float, to: str, data: str = ''):
+	lock(pair)
+	
+	assert amount0Out > 0 or amount1Out > 0, 'SNAKX: INSUFFICIENT_OUTPUT_AMOUNT'
+	token0, token1, ignore, fee, amp = pairMeta(pair)
+	state = pairState(pair)
+	reserve0, reserve1, balance0, balance1 = state[0:4]
+	assert amount0Out < reserve0 and amount1Out < reserve1, 'SNAKX: INSUFFICIENT_LIQUIDITY'
+	assert to != token0 and to != token1, 'SNAKX: INVALID_TO'
+	
+	receiver = importlib.import_module(to)
+	assert importlib.enforce_interface(receiver, flash_interface), 'SNAKX: NO_CALLBACK'
+	
+	if (amount0Out > 0):
+		assert balance0 >= amount0Out, 'p2a Not enough coins to send!'
+		state[2] -= transferOut(token0, to, amount0Out)
+	if (amount1Out > 0):
+		assert balance1 >= amount1Out, 'p2a Not enough coins to send!'
+		state[3] -= transferOut(token1, to, amount1Out)
+	pairs[pair, "state"] = state
+	
+	locks[pair] = FLASH_LOCK
+	receiver.flashCallback(pair=pair, amount0Out=amount0Out, amount1Out=amount1Out, data=data)
+	locks[pair] = True
+	
+	#deposits made by the callback were credited to the stored state
+	state = pairState(pair)
+	balance0, balance1 = state[2:4]
+	assert balance0 >= 0 and balance1 >= 0, "SNAKX: NEGATIVE_BALANCE"
+	amount0In = balance0 - (reserve0 - amount0Out) if balance0 > reserve0 - amount0Out else 0
+	amount1In = balance1 - (reserve1 - amount1Out) if balance1 > reserve1 - amount1Out else 0
+	assert amount0In > 0 or amount1In > 0, 'SNAKX: INSUFFICIENT_INPUT_AMOUNT'
+	checkK(reserve0, reserve1, balance0, balance1, amount0In, amount1In, fee, amp)
+	
+	internal_swapUpdate(pair, state, balance0, balance1,
+		amount0In, amount1In, amount0Out, amount1Out, to)
+	
+	unlock(pair)
+	
+#whole route in one call: path is a list of pairs, amounts[x] goes into path[x]
+#and amounts[x+1] comes out of it, input must already be credited to path[0]
+#noreentry
+@export
+def swapPath(path: list, amounts: list, src: str, to: str):
+	assert len(path) >= 1, 'SNAKX: INVALID_PATH'
+	assert len(amounts) == len(path) + 1, 'SNAKX: INVALID_LENGTHS'
+	
+	for pair in path:
+		lock(pair)
+	
+	carry = 0
+	for x in range(0, len(path)):
+		pair = path[x]
+		token0, token1, ignore, fee, amp = pairMeta(pair)
+		order = (src == token0)
+		assert order or src == token1, 'SNAKX: INVALID_PATH'
+		
+		state = pairState(pair)
+		reserve0, reserve1, balance0, balance1 = state[0:4]
+		
+		if(order):
+			balance0 += carry
+		else:
+			balance1 += carry
+		
+		amountOut = amounts[x+1]
+		amount0Out = 0 if order else amountOut
+		amount1Out = amountOut if order else 0
+		assert amountOut > 0, 'SNAKX: INSUFFICIENT_OUTPUT_AMOUNT'
+		assert amount0Out < reserve0 and amount1Out < reserve1, 'SNAKX: INSUFFICIENT_LIQUIDITY'
+		
+		src = token1 if order else token0
+		recipient = to
+		if(x == len(path) - 1):
+			assert to != token0 and to != token1, 'SNAKX: INVALID_TO'
+			assert (balance1 if order else balance0) >= amountOut, 'p2a Not enough coins to send!'
+			sent = transferOut(src, to, amountOut)
+		else:
+			recipient = path[x+1]
+			sent = amountOut
+		carry = amountOut
+		
+		if(order):
+			balance1 -= sent
+		else:
+			balance0 -= sent
+		assert balance0 >= 0 and balance1 >= 0, "SNAKX: NEGATIVE_BALANCE"
+		
+		amount0In = balance0 - (reserve0 - amount0Out) if balance0 > reserve0 - amount0Out else 0
+		amount1In = balance1 - (reserve1 - amount1Out) if balance1 > reserve1 - amount1Out else 0
+		assert amount0In > 0 or amount1In > 0, 'SNAKX: INSUFFICIENT_INPUT_AMOUNT'
+		checkK(reserve0, reserve1, balance0, balance1, amount0In, amount1In, fee, amp)
+		
+		internal_swapUpdate(pair, state, balance0, balance1,
+			amount0In, amount1In, amount0Out, amount1Out, recipient)
+	
+	for pair in path:
+		unlock(pair)